@@ -21,32 +21,154 @@ DoesNotExist возникает, если пользователь с данны
 ORM-преобразователе первичный ключ тоже может называться pk.
 """
 
-from django.contrib.auth.models import User
+import redis
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser, User
+from django.core.cache import cache
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+from django.db.models.functions import Lower
 from account.models import Profile
+from bookmarks.versions import get_versions, bump_version
 
 
-class EmailAuthBackend:
+def users_by_email(email):
     """
-    Аутентифицировать посредством адреса электронной почты.
+    Пользователи с данным адресом электронной почты без учета регистра.
+    Условие LOWER(email) = ... использует индекс account_user_email_lower_idx.
     """
+    return User.objects.annotate(email_lower=Lower('email')) \
+        .filter(email_lower=email.lower())
 
-    def authenticate(self, request, username=None, password=None):
-        try:
-            user = User.objects.get(email=username)
-            if user.check_password(password):
-                return user
-            return None
-        except (User.DoesNotExist, User.MultipleObjectsReturned):
-            return None
 
-    def get_user(self, user_id):
-        try:
-            return User.objects.get(pk=user_id)
-        except User.DoesNotExist:
+class EmailAuthBackend(ModelBackend):
+    """
+    Аутентифицировать посредством адреса электронной почты
+    либо имени пользователя.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None or password is None:
             return None
+        users = []
+        if '@' in username:
+            users = list(users_by_email(username)[:2])
+        if len(users) != 1:
+            # обычный вход по имени пользователя: символ @ допустим
+            # и в имени. Для несуществующего пользователя ModelBackend
+            # тоже хеширует пароль, и время ответа не выдает наличие
+            # адреса
+            return super().authenticate(request, username=username,
+                                        password=password, **kwargs)
+        user = users[0]
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+
+def create_profile(backend, user, *args, **kwargs):
+    """
+    Создать профиль пользователя для социальной аутентификации
+    """
+    Profile.objects.get_or_create(user=user)
+
+
+def user_version_key(user_id):
+    return f'auth:user:{user_id}:version'
+
+
+def user_cache_key(user_id, version):
+    return f'auth:user:{user_id}:v{version}'
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, **kwargs):
+    bump_version(user_version_key(instance.pk))
+
+
+@receiver(post_save, sender=Profile)
+def profile_saved(sender, instance, **kwargs):
+    bump_version(user_version_key(instance.user_id))
+
+
+def _load_user(backend, user_id):
+    """
+    Загрузить пользователя через бэкенд и сразу присоединить профиль,
+    чтобы request.user.profile не требовал отдельного запроса.
+    """
+    user = backend.get_user(user_id)
+    if isinstance(user, User):
+        profile = Profile.objects.filter(user_id=user.pk).first()
+        if profile is not None:
+            user.profile = profile
+        else:
+            User.profile.related.set_cached_value(user, None)
+    return user
+
+
+def get_cached_user(request):
+    """
+    Аналог django.contrib.auth.get_user(), который берет пользователя
+    вместе с профилем из кеша. Запись действительна, пока не изменилась
+    версия, увеличиваемая при сохранении пользователя или профиля.
+    """
+    try:
+        user_id = auth._get_user_session_key(request)
+        backend_path = request.session[auth.BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return AnonymousUser()
+    backend = auth.load_backend(backend_path)
+    try:
+        version, = get_versions(user_version_key(user_id))
+        key = user_cache_key(user_id, version)
+        user = cache.get(key)
+        if user is None:
+            user = _load_user(backend, user_id)
+            if user is not None:
+                cache.set(key, user, settings.AUTH_USER_CACHE_TTL)
+    except redis.RedisError:
+        user = _load_user(backend, user_id)
+    if user is None:
+        return AnonymousUser()
+    session_hash = request.session.get(auth.HASH_SESSION_KEY)
+    if session_hash and constant_time_compare(
+            session_hash, user.get_session_auth_hash()):
+        return user
+    # хеш сеанса не совпал: проверку запасных ключей и сброс сеанса
+    # выполняет стандартная функция
+    return auth.get_user(request)
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    Заменяет AuthenticationMiddleware: request.user загружается
+    из кеша, а не из базы данных при каждом запросе.
+    """
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
+
+
+"""
+Бэкенд заменяет в AUTHENTICATION_BACKENDS стандартный ModelBackend:
+идентификатор с символом @ сначала ищется по адресу электронной почты,
+остальные - сразу по имени пользователя. Если адрес не найден, вход
+проверяется по имени пользователя, которое тоже может содержать @.
+Обычный вход выполняет один запрос и одну проверку хеша пароля. Адрес сравнивается в нижнем регистре
+по индексу на выражении LOWER(email); тот же поиск используется формами
+регистрации и редактирования профиля.
 
-    def create_profile(backend, user, *args, **kwargs):
-        """
-        Создать профиль пользователя для социальной аутентификации
-        """
-        Profile.objects.get_or_create(user=user)
+Промежуточный программный компонент CachedAuthenticationMiddleware
+хранит в кеше пользователя вместе с профилем под ключом с номером версии;
+сохранение User или Profile увеличивает версию, и следующий запрос заново
+читает запись из базы данных. Поэтому обычный просмотр страницы
+не выполняет запросов для определения пользователя независимо от того,
+каким бэкендом (по паролю или социальным) пользователь вошел."""
@@ -0,0 +1,159 @@
+import csv
+import json
+import zipfile
+from django.core.files.storage import default_storage
+from actions.models import Action
+from images.models import Image
+
+# сколько строк получать из курсора базы данных за раз
+CHUNK_SIZE = 2000
+# размер блока при копировании файлов изображений в архив
+FILE_BLOCK_SIZE = 64 * 1024
+
+FORMATS = {
+    'csv': 'text/csv',
+    'jsonl': 'application/x-ndjson',
+    'zip': 'application/zip',
+}
+
+
+def bookmarks(user):
+    return Image.objects.filter(user=user).order_by('id').values_list(
+        'id', 'title', 'url', 'description', 'created', 'total_likes',
+        'status', 'image')
+
+
+def likes(user):
+    return Image.users_like.through.objects.filter(user=user) \
+        .order_by('id').values_list('image_id', 'image__title',
+                                    'image__url')
+
+
+def actions(user):
+    return Action.objects.filter(user=user).order_by('id').values_list(
+        'id', 'verb', 'created', 'target_ct__app_label',
+        'target_ct__model', 'target_id')
+
+
+# наборы данных экспорта: заголовки столбцов и запрос
+DATASETS = {
+    'bookmarks': (['id', 'title', 'url', 'description', 'created',
+                   'total_likes', 'status', 'file'], bookmarks),
+    'likes': (['image_id', 'title', 'url'], likes),
+    'actions': (['id', 'verb', 'created', 'target_app', 'target_model',
+                 'target_id'], actions),
+}
+
+
+def export_rows(user, dataset):
+    """
+    Построчно вернуть данные набора. iterator() читает строки
+    из курсора пачками по CHUNK_SIZE, не заполняя кеш QuerySet.
+    """
+    _, queryset = DATASETS[dataset]
+    for row in queryset(user).iterator(chunk_size=CHUNK_SIZE):
+        yield [value.isoformat() if hasattr(value, 'isoformat') else value
+               for value in row]
+
+
+class Echo:
+    """
+    Объект с методом write(), который возвращает записанное значение
+    вместо его сохранения; позволяет использовать csv.writer в генераторе.
+    """
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(user, dataset):
+    writer = csv.writer(Echo())
+    header, _ = DATASETS[dataset]
+    yield writer.writerow(header)
+    for row in export_rows(user, dataset):
+        yield writer.writerow(row)
+
+
+def stream_jsonl(user, datasets):
+    for dataset in datasets:
+        header, _ = DATASETS[dataset]
+        for row in export_rows(user, dataset):
+            yield json.dumps({'type': dataset, **dict(zip(header, row))},
+                             ensure_ascii=False) + '\n'
+
+
+class ZipStream:
+    """
+    Файлоподобный объект без seek() и tell(), в который пишет
+    zipfile.ZipFile. Записанные байты забираются методом pop().
+    """
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def stream_zip(user):
+    """
+    Архив ZIP с CSV-файлами всех наборов данных и исходными файлами
+    изображений пользователя. Архив формируется по мере отправки.
+    """
+    stream = ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for dataset in DATASETS:
+            with archive.open(f'{dataset}.csv', 'w') as f:
+                for line in stream_csv(user, dataset):
+                    f.write(line.encode())
+                    if stream.chunks:
+                        yield stream.pop()
+            yield stream.pop()
+        # один файл может принадлежать нескольким закладкам
+        names = Image.objects.filter(user=user).exclude(image='') \
+            .order_by('image').values_list('image', flat=True).distinct()
+        for name in names.iterator(chunk_size=CHUNK_SIZE):
+            try:
+                source = default_storage.open(name, 'rb')
+            except FileNotFoundError:
+                continue
+            # путь в архиве совпадает со столбцом file в bookmarks.csv
+            with source, archive.open(f'files/{name}', 'w') as f:
+                while block := source.read(FILE_BLOCK_SIZE):
+                    f.write(block)
+                    yield stream.pop()
+            yield stream.pop()
+    # центральный каталог архива
+    yield stream.pop()
+
+
+def stream_export(user, export_format, dataset):
+    """
+    Генератор частей экспорта в формате csv, jsonl или zip.
+    CSV содержит один набор данных, JSONL - выбранный или все.
+    """
+    if export_format == 'csv':
+        return stream_csv(user, dataset or 'bookmarks')
+    if export_format == 'jsonl':
+        return stream_jsonl(user, [dataset] if dataset else DATASETS)
+    return stream_zip(user)
+
+
+"""
+Экспорт не загружает данные в память целиком: запросы values_list()
+не создают объекты моделей, а iterator() получает строки из курсора
+базы данных пачками (в PostgreSQL - через курсор на стороне сервера).
+Каждая строка сразу превращается в часть ответа StreamingHttpResponse
+или записывается в файл командой export_user, поэтому расход памяти
+не зависит от числа закладок. zipfile умеет писать в поток без seek():
+после каждой записи готовые байты забираются из ZipStream и
+отправляются клиенту."""
@@ -0,0 +1,48 @@
+from django.db import transaction
+from django.db.models import F
+from .models import Contact, Profile
+
+
+def follow_user(user_from, user_to):
+    """
+    Подписать user_from на user_to и увеличить счетчики обоих профилей
+    в одной транзакции. Вернуть True, если подписка была создана.
+    Уникальное ограничение (user_from, user_to) не дает одновременным
+    запросам создать вторую подписку: get_or_create() получает
+    IntegrityError, находит существующую строку и возвращает
+    created=False, поэтому счетчики увеличиваются один раз.
+    """
+    with transaction.atomic():
+        _, created = Contact.objects.get_or_create(user_from=user_from,
+                                                   user_to=user_to)
+        if created:
+            Profile.objects.filter(user=user_to) \
+                .update(followers_count=F('followers_count') + 1)
+            Profile.objects.filter(user=user_from) \
+                .update(following_count=F('following_count') + 1)
+    return created
+
+
+def unfollow_user(user_from, user_to):
+    """
+    Отписать user_from от user_to и уменьшить счетчики обоих профилей.
+    Вернуть True, если подписка была удалена.
+    """
+    with transaction.atomic():
+        deleted, _ = Contact.objects.filter(user_from=user_from,
+                                            user_to=user_to).delete()
+        if deleted:
+            Profile.objects.filter(user=user_to, followers_count__gt=0) \
+                .update(followers_count=F('followers_count') - 1)
+            Profile.objects.filter(user=user_from, following_count__gt=0) \
+                .update(following_count=F('following_count') - 1)
+    return bool(deleted)
+
+
+def is_following(user_from, user_to):
+    """
+    Проверить подписку одной строкой по уникальному индексу
+    (user_from, user_to).
+    """
+    return Contact.objects.filter(user_from=user_from,
+                                  user_to=user_to).exists()
@@ -1,6 +1,7 @@
 from django import forms
 from django.contrib.auth.models import User
 from .models import Profile
+from .authentication import users_by_email
 
 
 class LoginForm(forms.Form):
@@ -29,7 +30,7 @@ class UserRegistrationForm(forms.ModelForm):
     def clean_email(self):
         data = self.cleaned_data.get('email')
 
-        if User.objects.filter(email=data).exists():
+        if data and users_by_email(data).exists():
             raise forms.ValidationError('Email already in use.')
 
         return data
@@ -51,9 +52,9 @@ class UserEditForm(forms.ModelForm):
 
     def clean_email(self):
         data = self.cleaned_data['email']
-        qs = User.objects.exclude(id=self.instance.id).filter(email=data)
+        qs = users_by_email(data).exclude(id=self.instance.id)
 
-        if qs.exists():
+        if data and qs.exists():
             raise forms.ValidationError('Email already in use.')
         return data
 
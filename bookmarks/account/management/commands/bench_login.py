@@ -0,0 +1,70 @@
+import time
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+PASSWORD = 'bench-password'
+
+
+class Command(BaseCommand):
+    help = 'Измерить пропускную способность входа по адресу электронной почты'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000,
+                            help='Сколько тестовых пользователей создать')
+        parser.add_argument('--logins', type=int, default=500,
+                            help='Сколько входов выполнить')
+        parser.add_argument('--backend', action='append', dest='backends',
+                            help='Бэкенд аутентификации (можно указать '
+                                 'несколько раз), по умолчанию из настроек')
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help='Хешировать пароли MD5, чтобы в замере '
+                                 'была видна стоимость поиска пользователя')
+        parser.add_argument('--keep', action='store_true',
+                            help='Не удалять тестовых пользователей')
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options['backends']:
+            overrides['AUTHENTICATION_BACKENDS'] = options['backends']
+        if options['fast_hasher']:
+            overrides['PASSWORD_HASHERS'] = FAST_HASHERS
+        with override_settings(**overrides):
+            self.create_users(options['users'])
+            try:
+                self.run(options['users'], options['logins'])
+            finally:
+                if not options['keep']:
+                    User.objects.filter(username__startswith='bench_login_') \
+                        .delete()
+
+    def create_users(self, count):
+        existing = User.objects.filter(username__startswith='bench_login_') \
+            .count()
+        # пароль хешируется один раз для всех пользователей
+        password = make_password(PASSWORD)
+        users = [User(username=f'bench_login_{i}',
+                      email=f'Bench.Login.{i}@example.com',
+                      password=password)
+                 for i in range(existing, count)]
+        User.objects.bulk_create(users, batch_size=1000)
+
+    def run(self, users, logins):
+        step = max(users // logins, 1)
+        emails = [f'bench.login.{i * step % users}@example.com'
+                  for i in range(logins)]
+        failed = 0
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for email in emails:
+                if authenticate(username=email, password=PASSWORD) is None:
+                    failed += 1
+            elapsed = time.perf_counter() - start
+        self.stdout.write(f'{logins} logins in {elapsed:.2f}s: '
+                          f'{logins / elapsed:.1f} logins/s, '
+                          f'{len(queries) / logins:.1f} queries/login, '
+                          f'{failed} failed')
@@ -0,0 +1,205 @@
+import json
+import random
+import statistics
+import time
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from bookmarks.redis_client import stats as redis_stats
+from images.models import Image
+from images.ranking import PERIODS
+
+ENDPOINTS = ['dashboard', 'image_list', 'image_detail', 'image_ranking',
+             'user_detail', 'image_like', 'user_follow']
+
+
+def percentile(values, percent):
+    """
+    Процентиль методом ближайшего ранга.
+    """
+    values = sorted(values)
+    index = max(int(round(percent / 100 * len(values))) - 1, 0)
+    return values[index]
+
+
+class Scenarios:
+    """
+    Запросы к каждой конечной точке. Изображения и пользователи
+    выбираются из выборки, поэтому ответы не ограничиваются кешем
+    для одного объекта.
+    """
+
+    def __init__(self, user, rng, sample_size):
+        self.rng = rng
+        self.images = list(
+            Image.objects.filter(status=Image.Status.READY)
+            .order_by('-total_likes').values_list('id', 'slug')
+            [:sample_size])
+        self.users = list(
+            User.objects.filter(is_active=True).exclude(id=user.id)
+            .order_by('-profile__followers_count')
+            .values_list('id', 'username')[:sample_size])
+        if not self.images or not self.users:
+            raise CommandError('Not enough data, run generate_data first')
+        self.cursor = None
+        self.liked = set()
+        self.followed = set(user.following.values_list('id', flat=True))
+
+    def dashboard(self):
+        return 'get', reverse('dashboard'), None
+
+    def image_list(self):
+        # прокрутка: первая страница, затем AJAX-страницы по курсору
+        if self.cursor is None:
+            return 'get', reverse('images:list'), None
+        return 'get', reverse('images:list'), {'images_only': 1,
+                                               'cursor': self.cursor}
+
+    def image_list_done(self, response):
+        cursor = response.get('X-Next-Cursor')
+        self.cursor = cursor or None
+
+    def image_detail(self):
+        image_id, slug = self.rng.choice(self.images)
+        return 'get', reverse('images:detail', args=[image_id, slug]), None
+
+    def image_ranking(self):
+        return 'get', reverse('images:ranking'), \
+            {'period': self.rng.choice(PERIODS)}
+
+    def user_detail(self):
+        _, username = self.rng.choice(self.users)
+        return 'get', reverse('user_detail', args=[username]), None
+
+    def image_like(self):
+        image_id, _ = self.rng.choice(self.images)
+        action = 'unlike' if image_id in self.liked else 'like'
+        self.liked ^= {image_id}
+        return 'post', reverse('images:like'), {'id': image_id,
+                                                'action': action}
+
+    def user_follow(self):
+        user_id, _ = self.rng.choice(self.users)
+        action = 'unfollow' if user_id in self.followed else 'follow'
+        self.followed ^= {user_id}
+        return 'post', reverse('user_follow'), {'id': user_id,
+                                                'action': action}
+
+
+class Command(BaseCommand):
+    help = 'Измерить задержки, число SQL-запросов и команд redis ' \
+           'для основных страниц'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Число замеряемых запросов на страницу')
+        parser.add_argument('--warmup', type=int, default=20,
+                            help='Число запросов для прогрева')
+        parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS,
+                            default=ENDPOINTS)
+        parser.add_argument('--username',
+                            help='От чьего имени выполнять запросы, по '
+                                 'умолчанию пользователь с наибольшим '
+                                 'числом подписок')
+        parser.add_argument('--sample', type=int, default=1000,
+                            help='Размер выборки изображений и пользователей')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        if settings.DEBUG:
+            self.stderr.write('DEBUG is on, timings will be pessimistic')
+        user = self.get_user(options['username'])
+        scenarios = Scenarios(user, random.Random(options['seed']),
+                              options['sample'])
+        host = next((host for host in settings.ALLOWED_HOSTS
+                     if '*' not in host and not host.startswith('.')),
+                    'localhost')
+        # REMOTE_ADDR вне INTERNAL_IPS, чтобы не выводить debug toolbar
+        client = Client(HTTP_HOST=host, REMOTE_ADDR='192.0.2.1')
+        client.force_login(user)
+
+        results = {}
+        for endpoint in options['endpoints']:
+            for _ in range(options['warmup']):
+                self.request(client, scenarios, endpoint)
+            samples = [self.request(client, scenarios, endpoint)
+                       for _ in range(options['requests'])]
+            results[endpoint] = self.summarize(samples)
+            self.stdout.write(self.format_result(endpoint,
+                                                 results[endpoint]))
+
+        report = {
+            'started': timezone.now().isoformat(),
+            'user': user.username,
+            'database': connection.vendor,
+            'redis_backend': settings.REDIS_BACKEND,
+            'debug': settings.DEBUG,
+            'requests': options['requests'],
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f'Results written to {options["output"]}'))
+
+    def get_user(self, username):
+        users = User.objects.filter(is_active=True)
+        if username:
+            user = users.filter(username=username).first()
+        else:
+            user = users.order_by('-profile__following_count').first()
+        if user is None:
+            raise CommandError('No user to run the benchmark as')
+        return user
+
+    def request(self, client, scenarios, endpoint):
+        method, path, data = getattr(scenarios, endpoint)()
+        commands, round_trips = redis_stats.snapshot()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(path, data)
+            elapsed = time.perf_counter() - start
+        after = redis_stats.snapshot()
+        done = getattr(scenarios, f'{endpoint}_done', None)
+        if done is not None:
+            done(response)
+        return {
+            'time': elapsed,
+            'queries': len(queries),
+            'redis_commands': after[0] - commands,
+            'redis_round_trips': after[1] - round_trips,
+            'error': response.status_code != 200,
+        }
+
+    def summarize(self, samples):
+        times = [sample['time'] * 1000 for sample in samples]
+        count = len(samples)
+        return {
+            'requests': count,
+            'errors': sum(sample['error'] for sample in samples),
+            'p50_ms': round(percentile(times, 50), 3),
+            'p99_ms': round(percentile(times, 99), 3),
+            'mean_ms': round(statistics.mean(times), 3),
+            'queries_per_request': round(
+                sum(sample['queries'] for sample in samples) / count, 2),
+            'redis_commands_per_request': round(
+                sum(sample['redis_commands'] for sample in samples)
+                / count, 2),
+            'redis_round_trips_per_request': round(
+                sum(sample['redis_round_trips'] for sample in samples)
+                / count, 2),
+        }
+
+    def format_result(self, endpoint, result):
+        return (f'{endpoint:<14} p50 {result["p50_ms"]:8.2f} ms  '
+                f'p99 {result["p99_ms"]:8.2f} ms  '
+                f'{result["queries_per_request"]:6.2f} queries  '
+                f'{result["redis_commands_per_request"]:6.2f} redis cmds  '
+                f'{result["errors"]} errors')
@@ -0,0 +1,44 @@
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from account.export import DATASETS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Выгрузить закладки, лайки и действия пользователя ' \
+           'в CSV, JSONL или ZIP'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username')
+        parser.add_argument('--format', choices=list(FORMATS),
+                            default='csv')
+        parser.add_argument('--data', choices=list(DATASETS),
+                            help='Набор данных; по умолчанию bookmarks '
+                                 'для CSV и все наборы для JSONL')
+        parser.add_argument('--output',
+                            help='Файл для выгрузки, по умолчанию stdout')
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User {options["username"]} does not exist')
+        chunks = stream_export(user, options['format'], options['data'])
+        # части выгрузки записываются сразу по мере получения
+        binary = options['format'] == 'zip'
+        if options['output']:
+            if binary:
+                output = open(options['output'], 'wb')
+            else:
+                output = open(options['output'], 'w', newline='',
+                              encoding='utf-8')
+        else:
+            output = sys.stdout.buffer if binary else sys.stdout
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if options['output']:
+                output.close()
+        if options['output']:
+            self.stderr.write(f'Exported to {options["output"]}')
@@ -0,0 +1,289 @@
+import io
+import random
+from collections import Counter
+from datetime import timedelta
+from itertools import accumulate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from PIL import Image as PILImage
+from account.models import Contact, Profile
+from actions.feed import rebuild_feed
+from actions.models import Action
+from bookmarks.redis_client import pipeline
+from bookmarks.versions import bump_version
+from images.counters import views_key
+from images.fragments import LIST_VERSION_KEY
+from images.hashing import url_hash
+from images.ingest import store
+from images.models import Image
+from images.search import index_images
+from images.ranking import record_views
+
+ImageLike = Image.users_like.through
+
+
+def power_law(rng, mean, shape=1.5):
+    """
+    Случайное число из распределения Парето с заданным средним:
+    у большинства значений немного, у единиц - очень много.
+    """
+    return int(rng.paretovariate(shape) * mean * (shape - 1) / shape)
+
+
+def zipf_weights(count, alpha):
+    """
+    Накопленные веса закона Ципфа: элемент с рангом r
+    выбирается с вероятностью, пропорциональной 1 / r ** alpha.
+    """
+    return list(accumulate(1 / (rank + 1) ** alpha for rank in range(count)))
+
+
+class Command(BaseCommand):
+    help = 'Сгенерировать пользователей, подписки, изображения, лайки, ' \
+           'просмотры и действия со степенным распределением популярности'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--images', type=float, default=10,
+                            help='Среднее число изображений на пользователя')
+        parser.add_argument('--follows', type=float, default=20,
+                            help='Среднее число подписок на пользователя')
+        parser.add_argument('--likes', type=float, default=30,
+                            help='Среднее число лайков на пользователя')
+        parser.add_argument('--views', type=float, default=100,
+                            help='Среднее число просмотров изображения')
+        parser.add_argument('--alpha', type=float, default=1.1,
+                            help='Показатель закона Ципфа для популярности')
+        parser.add_argument('--files', type=int, default=20,
+                            help='Сколько разных файлов изображений создать')
+        parser.add_argument('--prefix', default='gen',
+                            help='Префикс имен создаваемых пользователей')
+        parser.add_argument('--password', default='generated')
+        parser.add_argument('--days', type=int, default=365,
+                            help='За сколько последних дней распределить '
+                                 'даты изображений и действий')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not connection.features.can_return_rows_from_bulk_insert:
+            raise CommandError('The database backend cannot return ids '
+                               'from bulk inserts')
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f'Users with prefix {prefix!r} already exist')
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        user_ids = self.create_users(prefix, options['users'])
+        contacts = self.plan_contacts(user_ids)
+        images_per_user = {user_id: power_law(self.rng, options['images'])
+                           for user_id in user_ids}
+        self.create_profiles(user_ids, contacts, images_per_user)
+        Contact.objects.bulk_create(
+            [Contact(user_from_id=user_from, user_to_id=user_to)
+             for user_from, user_to in contacts],
+            batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(contacts)} contact(s)')
+        image_owners, image_times = self.create_images(images_per_user)
+        image_ids = list(image_owners)
+        likes = self.create_likes(user_ids, image_ids)
+        self.record_views(image_ids)
+        self.create_actions(user_ids, contacts, image_owners, image_times,
+                            likes)
+        bump_version(LIST_VERSION_KEY)
+        self.stdout.write(self.style.SUCCESS('Done'))
+
+    def random_time(self, start=None):
+        """
+        Случайный момент между start (по умолчанию --days дней назад)
+        и текущим временем.
+        """
+        if start is None:
+            start = self.now - timedelta(days=self.options['days'])
+        return start + (self.now - start) * self.rng.random()
+
+    def create_users(self, prefix, count):
+        # пароль хешируется один раз для всех пользователей
+        password = make_password(self.options['password'])
+        users = User.objects.bulk_create(
+            [User(username=f'{prefix}_{i}',
+                  first_name=f'User {i}',
+                  email=f'{prefix}_{i}@example.com',
+                  password=password)
+             for i in range(count)],
+            batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(users)} user(s)')
+        return [user.id for user in users]
+
+    def plan_contacts(self, user_ids):
+        """
+        Каждый пользователь подписывается на случайное число
+        пользователей, выбранных пропорционально их популярности.
+        """
+        popular = user_ids[:]
+        self.rng.shuffle(popular)
+        weights = zipf_weights(len(popular), self.options['alpha'])
+        contacts = set()
+        for user_id in user_ids:
+            count = min(power_law(self.rng, self.options['follows']),
+                        len(user_ids) - 1)
+            for user_to in self.rng.choices(popular, cum_weights=weights,
+                                            k=count):
+                if user_to != user_id:
+                    contacts.add((user_id, user_to))
+        return contacts
+
+    def create_profiles(self, user_ids, contacts, images_per_user):
+        followers = Counter(user_to for _, user_to in contacts)
+        following = Counter(user_from for user_from, _ in contacts)
+        Profile.objects.bulk_create(
+            [Profile(user_id=user_id,
+                     followers_count=followers[user_id],
+                     following_count=following[user_id],
+                     images_count=images_per_user[user_id])
+             for user_id in user_ids],
+            batch_size=self.batch_size)
+
+    def create_files(self):
+        """
+        Сохранить несколько небольших файлов, на которые ссылаются
+        все созданные изображения.
+        """
+        files = []
+        for i in range(self.options['files']):
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            content = io.BytesIO()
+            PILImage.new('RGB', (640, 480), color).save(content, 'PNG')
+            name, digest, phash, _ = store(content.getvalue(), 'png',
+                                           f'generated-{i}')
+            files.append((name, digest, phash))
+        return files
+
+    def create_images(self, images_per_user):
+        files = self.create_files()
+        prefix = self.options['prefix']
+        images = []
+        for user_id, count in images_per_user.items():
+            for _ in range(count):
+                number = len(images)
+                url = f'https://example.com/{prefix}/{number}.png'
+                name, digest, phash = files[number % len(files)]
+                images.append(Image(user_id=user_id,
+                                    title=f'Image {number}',
+                                    slug=f'image-{number}',
+                                    url=url,
+                                    url_hash=url_hash(url),
+                                    image=name,
+                                    content_hash=digest,
+                                    phash=phash,
+                                    status=Image.Status.READY))
+        # изображения разных пользователей перемешаны, и более поздние
+        # ИД получают более поздние даты, как при обычной работе
+        self.rng.shuffle(images)
+        times = sorted(self.random_time() for _ in images)
+        images = Image.objects.bulk_create(images,
+                                           batch_size=self.batch_size)
+        # bulk_create() заменяет поле с auto_now_add текущей датой,
+        # поэтому даты записываются отдельно
+        for image, created in zip(images, times):
+            image.created = created.date()
+        Image.objects.bulk_update(images, ['created'],
+                                  batch_size=self.batch_size)
+        index_images(images)
+        self.stdout.write(f'Created {len(images)} image(s)')
+        return ({image.id: image.user_id for image in images},
+                {image.id: created for image, created in zip(images, times)})
+
+    def create_likes(self, user_ids, image_ids):
+        if not image_ids:
+            return set()
+        popular = image_ids[:]
+        self.rng.shuffle(popular)
+        weights = zipf_weights(len(popular), self.options['alpha'])
+        likes = set()
+        for user_id in user_ids:
+            count = min(power_law(self.rng, self.options['likes']),
+                        len(image_ids))
+            for image_id in self.rng.choices(popular, cum_weights=weights,
+                                             k=count):
+                likes.add((user_id, image_id))
+        ImageLike.objects.bulk_create(
+            [ImageLike(user_id=user_id, image_id=image_id)
+             for user_id, image_id in likes],
+            batch_size=self.batch_size)
+        totals = Counter(image_id for _, image_id in likes)
+        Image.objects.bulk_update(
+            [Image(id=image_id, total_likes=total)
+             for image_id, total in totals.items()],
+            ['total_likes'], batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(likes)} like(s)')
+        return likes
+
+    def record_views(self, image_ids):
+        """
+        Распределить просмотры по закону Ципфа и записать их
+        в счетчики и рейтинги redis.
+        """
+        if not image_ids:
+            return
+        popular = image_ids[:]
+        self.rng.shuffle(popular)
+        weights = [1 / (rank + 1) ** self.options['alpha']
+                   for rank in range(len(popular))]
+        total = self.options['views'] * len(popular)
+        scale = total / sum(weights)
+        views = {image_id: int(weight * scale)
+                 for image_id, weight in zip(popular, weights)}
+        views = {image_id: count for image_id, count in views.items()
+                 if count}
+        items = list(views.items())
+        for start in range(0, len(items), self.batch_size):
+            batch = dict(items[start:start + self.batch_size])
+            pipe = pipeline()
+            for image_id, count in batch.items():
+                pipe.incrby(views_key(image_id), count)
+            record_views(pipe, batch)
+            pipe.execute()
+        self.stdout.write(f'Recorded {sum(views.values())} view(s)')
+
+    def create_actions(self, user_ids, contacts, image_owners, image_times,
+                       likes):
+        image_ct = ContentType.objects.get_for_model(Image)
+        user_ct = ContentType.objects.get_for_model(User)
+        actions = [Action(user_id=user_id, verb='has created an account',
+                          created=self.random_time())
+                   for user_id in user_ids]
+        actions += [Action(user_id=owner_id, verb='bookmarked image',
+                           target_ct=image_ct, target_id=image_id,
+                           created=image_times[image_id])
+                    for image_id, owner_id in image_owners.items()]
+        actions += [Action(user_id=user_from, verb='is following',
+                           target_ct=user_ct, target_id=user_to,
+                           created=self.random_time())
+                    for user_from, user_to in contacts]
+        # изображение лайкают после того, как его добавили
+        actions += [Action(user_id=user_id, verb='likes',
+                           target_ct=image_ct, target_id=image_id,
+                           created=self.random_time(image_times[image_id]))
+                    for user_id, image_id in likes]
+        # действия разных видов перемешаны, как при обычной работе,
+        # и более поздние ИД получают более поздние даты
+        actions.sort(key=lambda action: action.created)
+        times = [action.created for action in actions]
+        Action.objects.bulk_create(actions, batch_size=self.batch_size)
+        for action, created in zip(actions, times):
+            action.created = created
+        Action.objects.bulk_update(actions, ['created'],
+                                   batch_size=self.batch_size)
+        self.stdout.write(f'Created {len(actions)} action(s)')
+        followers = {user_from for user_from, _ in contacts}
+        for user_id in followers:
+            rebuild_feed(User(id=user_id))
+        self.stdout.write(f'Built {len(followers)} feed(s)')
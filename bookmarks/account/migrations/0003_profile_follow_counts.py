@@ -0,0 +1,42 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_follows(apps, schema_editor):
+    Profile = apps.get_model('account', 'Profile')
+    Contact = apps.get_model('account', 'Contact')
+
+    def count(field):
+        return Coalesce(Subquery(
+            Contact.objects.filter(**{field: OuterRef('user_id')})
+            .order_by().values(field)
+            .annotate(total=Count('id')).values('total')), 0)
+
+    Profile.objects.update(followers_count=count('user_to'),
+                           following_count=count('user_from'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_contact'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='contact',
+            index=models.Index(fields=['user_from', 'user_to'], name='account_con_user_fr_198df8_idx'),
+        ),
+        migrations.RunPython(count_follows, migrations.RunPython.noop),
+    ]
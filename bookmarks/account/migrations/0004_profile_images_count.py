@@ -0,0 +1,29 @@
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_images(apps, schema_editor):
+    Profile = apps.get_model('account', 'Profile')
+    Image = apps.get_model('images', 'Image')
+    images = Image.objects.filter(user_id=OuterRef('user_id')) \
+        .order_by().values('user_id') \
+        .annotate(total=Count('id')).values('total')
+    Profile.objects.update(images_count=Coalesce(Subquery(images), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_profile_follow_counts'),
+        ('images', '0005_image_user_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='images_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_profile_images_count'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX account_user_email_lower_idx '
+            'ON auth_user (LOWER(email));',
+            'DROP INDEX account_user_email_lower_idx;',
+        ),
+    ]
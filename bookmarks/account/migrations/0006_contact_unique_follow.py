@@ -0,0 +1,54 @@
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicates(apps, schema_editor):
+    """
+    Оставить одну подписку из каждой группы повторов и пересчитать
+    счетчики затронутых профилей.
+    """
+    Contact = apps.get_model('account', 'Contact')
+    Profile = apps.get_model('account', 'Profile')
+    duplicates = list(Contact.objects.values('user_from', 'user_to')
+                      .annotate(first_id=Min('id'), total=Count('id'))
+                      .filter(total__gt=1))
+    users = set()
+    for duplicate in duplicates:
+        Contact.objects.filter(user_from=duplicate['user_from'],
+                               user_to=duplicate['user_to']) \
+            .exclude(id=duplicate['first_id']).delete()
+        users.update([duplicate['user_from'], duplicate['user_to']])
+    if not users:
+        return
+
+    def count(field):
+        return Coalesce(Subquery(
+            Contact.objects.filter(**{field: OuterRef('user_id')})
+            .order_by().values(field)
+            .annotate(total=Count('id')).values('total')), 0)
+
+    Profile.objects.filter(user_id__in=users) \
+        .update(followers_count=count('user_to'),
+                following_count=count('user_from'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_user_email_lower_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicates, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='contact',
+            name='account_con_user_fr_198df8_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='contact',
+            constraint=models.UniqueConstraint(
+                fields=('user_from', 'user_to'),
+                name='account_contact_unique_follow'),
+        ),
+    ]
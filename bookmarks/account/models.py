@@ -9,6 +9,9 @@ class Profile(models.Model):
     date_of_birth = models.DateField(blank=True, null=True)
     photo = models.ImageField(upload_to='users/%Y/%m/%d/',
                               blank=True)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    images_count = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return f'Profile of {self.user.username}'
@@ -50,6 +53,12 @@ class Contact(models.Model):
         indexes = [
             models.Index(fields=['-created']),
         ]
+        # уникальный индекс служит и для поиска подписки, и не дает
+        # одновременным запросам создать две одинаковые подписки
+        constraints = [
+            models.UniqueConstraint(fields=['user_from', 'user_to'],
+                                    name='account_contact_unique_follow'),
+        ]
         ordering = ['-created']
 
     def __str__(self):
@@ -0,0 +1,37 @@
+// Бесконечная прокрутка: когда пользователь приближается к концу
+// страницы, следующая порция HTML запрашивается по адресу pageUrl
+// с курсором из заголовка X-Next-Cursor предыдущего ответа и
+// добавляется в конец списка. Первый курсор берется из атрибута
+// data-next-cursor элемента списка.
+function infiniteScroll(list, pageUrl) {
+  if (!list) {
+    return;
+  }
+  var cursor = list.dataset.nextCursor;
+  var emptyPage = !cursor;
+  var blockRequest = false;
+  window.addEventListener('scroll', function(e) {
+    var margin = document.body.clientHeight - window.innerHeight - 200;
+    if(window.pageYOffset > margin && !emptyPage && !blockRequest) {
+      blockRequest = true;
+      fetch(pageUrl + '&cursor=' + encodeURIComponent(cursor))
+      .then(response => {
+        cursor = response.headers.get('X-Next-Cursor');
+        return response.text();
+      })
+      .then(html => {
+        if (html === '') {
+          emptyPage = true;
+        }
+        else {
+          list.insertAdjacentHTML('beforeEnd', html);
+          emptyPage = !cursor;
+          blockRequest = false;
+        }
+      })
+    }
+  });
+  // Запустить события прокрутки
+  const scrollEvent = new Event('scroll');
+  window.dispatchEvent(scrollEvent);
+}
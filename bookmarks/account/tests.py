@@ -1,3 +1,181 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import zipfile
+from datetime import date
+from django.contrib.auth import authenticate
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import IntegrityError, transaction
+from django.test import RequestFactory
+from django.urls import reverse
+from actions.models import Action
+from bookmarks.testing import MemoryRedisTestCase
+from images.models import Image
+from .authentication import get_cached_user
+from .export import stream_export
+from .follows import follow_user, is_following, unfollow_user
+from .models import Contact, Profile
 
-# Create your tests here.
+
+class FollowCountersTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        Profile.objects.create(user=self.alice)
+        Profile.objects.create(user=self.bob)
+
+    def assertCounts(self, following, followers):
+        self.assertEqual(
+            Profile.objects.get(user=self.alice).following_count, following)
+        self.assertEqual(
+            Profile.objects.get(user=self.bob).followers_count, followers)
+
+    def test_follow_twice_counts_once(self):
+        self.assertTrue(follow_user(self.alice, self.bob))
+        self.assertFalse(follow_user(self.alice, self.bob))
+        self.assertTrue(is_following(self.alice, self.bob))
+        self.assertEqual(Contact.objects.count(), 1)
+        self.assertCounts(1, 1)
+
+    def test_unfollow_twice_counts_once(self):
+        follow_user(self.alice, self.bob)
+        self.assertTrue(unfollow_user(self.alice, self.bob))
+        self.assertFalse(unfollow_user(self.alice, self.bob))
+        self.assertFalse(is_following(self.alice, self.bob))
+        self.assertCounts(0, 0)
+
+    def test_duplicate_follow_is_rejected(self):
+        Contact.objects.create(user_from=self.alice, user_to=self.bob)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Contact.objects.create(user_from=self.alice, user_to=self.bob)
+
+
+class EmailAuthBackendTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(
+            'carol', email='Carol@Example.com', password='secret-pass')
+
+    def test_email_is_case_insensitive(self):
+        self.assertEqual(authenticate(username='carol@example.com',
+                                      password='secret-pass'), self.user)
+
+    def test_username(self):
+        self.assertEqual(authenticate(username='carol',
+                                      password='secret-pass'), self.user)
+
+    def test_wrong_password(self):
+        self.assertIsNone(authenticate(username='carol@example.com',
+                                       password='wrong'))
+
+    def test_username_with_at_sign(self):
+        # адрес не найден, поэтому вход проверяется по имени пользователя
+        user = User.objects.create_user('dave@home', email='',
+                                        password='secret-pass')
+        self.assertEqual(authenticate(username='dave@home',
+                                      password='secret-pass'), user)
+
+    def test_unknown_email(self):
+        self.assertIsNone(authenticate(username='nobody@example.com',
+                                       password='secret-pass'))
+
+
+class ExportTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('erin', password='secret-pass')
+        Profile.objects.create(user=self.user)
+        self.images = [
+            Image.objects.create(user=self.user, title=f'Image {i}',
+                                 url=f'https://example.com/{i}.png')
+            for i in range(3)]
+        self.images[0].users_like.add(self.user)
+        Action.objects.create(user=self.user, verb='has created an account')
+        other = User.objects.create_user('frank')
+        Image.objects.create(user=other, title='Other',
+                             url='https://example.com/other.png')
+
+    def read(self, export_format, dataset=None):
+        chunks = stream_export(self.user, export_format, dataset)
+        if export_format == 'zip':
+            return b''.join(chunks)
+        return ''.join(chunks)
+
+    def test_csv(self):
+        rows = list(csv.reader(io.StringIO(self.read('csv'))))
+        self.assertEqual(rows[0][:3], ['id', 'title', 'url'])
+        self.assertEqual([row[1] for row in rows[1:]],
+                         ['Image 0', 'Image 1', 'Image 2'])
+
+    def test_jsonl(self):
+        rows = [json.loads(line)
+                for line in self.read('jsonl').splitlines()]
+        types = [row['type'] for row in rows]
+        self.assertEqual(types.count('bookmarks'), 3)
+        self.assertEqual(types.count('likes'), 1)
+        self.assertEqual(types.count('actions'), 1)
+
+    def test_zip(self):
+        archive = zipfile.ZipFile(io.BytesIO(self.read('zip')))
+        self.assertEqual(sorted(archive.namelist()),
+                         ['actions.csv', 'bookmarks.csv', 'likes.csv'])
+        bookmarks = archive.read('bookmarks.csv').decode().splitlines()
+        self.assertEqual(len(bookmarks), 4)
+
+    def test_view(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('export'),
+                                   {'format': 'jsonl', 'data': 'likes'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(b''.join(response.streaming_content)
+                             .splitlines()), 1)
+        response = self.client.get(reverse('export'), {'format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CachedAuthenticationTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('gina', password='secret-pass')
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+
+    def make_request(self):
+        request = RequestFactory().get('/')
+        request.session = self.client.session
+        # сеанс загружается заранее, чтобы не учитывать его запрос
+        request.session.items()
+        return request
+
+    def get_user(self):
+        return get_cached_user(self.make_request())
+
+    def test_user_is_cached(self):
+        self.assertEqual(self.get_user(), self.user)
+        request = self.make_request()
+        with self.assertNumQueries(0):
+            user = get_cached_user(request)
+            self.assertEqual(user, self.user)
+            self.assertIsNone(user.profile.date_of_birth)
+
+    def test_saved_profile_invalidates_cache(self):
+        self.get_user()
+        profile = Profile.objects.get(user=self.user)
+        profile.date_of_birth = date(2000, 1, 2)
+        profile.save()
+        self.assertEqual(self.get_user().profile.date_of_birth,
+                         date(2000, 1, 2))
+
+    def test_changed_password_ends_session(self):
+        self.get_user()
+        self.user.set_password('new-pass')
+        self.user.save()
+        self.assertIsInstance(self.get_user(), AnonymousUser)
+
+    def test_view_without_user_queries(self):
+        self.client.get(reverse('dashboard'))
+        # единственный запрос читает сеанс
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('edit'))
+        self.assertEqual(response.status_code, 200)
@@ -49,6 +49,8 @@ Django также содержит следующие ниже представ
 
 """
 
+import logging
+import redis
 from django.http import HttpResponse
 from django.shortcuts import render
 from django.contrib.auth import authenticate, login
@@ -58,11 +60,19 @@ from .models import Profile
 from django.contrib import messages
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseBadRequest, \
+    StreamingHttpResponse
 from django.views.decorators.http import require_POST
-from .models import Contact
+from .export import DATASETS, FORMATS, stream_export
+from .follows import follow_user, unfollow_user, is_following
 from actions.utils import create_action
+from actions.cards import render_action_cards
+from actions.feed import get_feed_ids, rebuild_feed
 from actions.models import Action
+from bookmarks.pagination import KeysetPaginator, InvalidCursor
+from images.fragments import render_images_page
+
+logger = logging.getLogger(__name__)
 
 
 def user_login(request):
@@ -88,35 +98,23 @@ def user_login(request):
 
 @login_required
 def dashboard(request):
-    actions = Action.objects.exclude(user=request.user)
-    following_ids = request.user.following.values_list('id',
-                                                       flat=True)
-    if following_ids:
-        # Если пользователь подписан на других,
-        # то извлечь только их действия
-        actions = actions.select_related('user', 'user__profile')[:10].prefetch_related('target')[:10]
-        """
-        Аргумент user__profile используется для того, чтобы выполнять операцию
-соединения на таблице Profile в одном SQL-запросе. Если вызвать select_related()
-без передачи каких-либо аргументов, то он будет извлекать объекты
-из всех взаимосвязей с внешними ключами ForeignKey. Следует всегда огра-
-ничивать метод select_related() взаимосвязями, которые будут доступны
-позже.Метод select_related() поможет повышать производительность при извле-
-чении связанных объектов во взаимосвязях один-ко-многим. Однако он не
-работает для взаимосвязей многие-ко-многим или многие-к-одному (поля
-ManyToMany или обратного внешнего ключа ForeignKey). Django предлагает
-другой QuerySet-метод под названием prefetch_related, который в допол-
-нение к взаимосвязям, поддерживаемым методом select_related(), успеш-
-но работает для взаимосвязей многие-ко-многим и многие-к-одному. Ме-
-тод prefetch_related() выполняет отдельный поиск по каждой взаимосвязи
-и соединяет результаты с по мощью Python. Этот метод также поддерживает
-упреждающую выборку полей GenericRelation и GenericForeignKey."""
-    actions = actions[:10]
+    # Прочитать окно фиксированного размера из ленты пользователя
+    try:
+        action_ids = get_feed_ids(request.user, 10)
+    except redis.RedisError:
+        logger.warning('Redis unavailable, reading the feed from the database')
+        following_ids = request.user.following.values_list('id', flat=True)
+        action_ids = list(Action.objects.filter(user_id__in=following_ids)
+                          .values_list('id', flat=True)[:10])
+    if not action_ids and not request.user.following.exists():
+        # Если пользователь ни на кого не подписан,
+        # то показать последние действия других пользователей
+        action_ids = list(Action.objects.exclude(user=request.user)
+                          .values_list('id', flat=True)[:10])
     return render(request,
                   'account/dashboard.html',
                   {'section': 'dashboard',
-                   'actions': actions})
-
+                   'action_cards': render_action_cards(action_ids)})
 
 """
 Мы создали представление dashboard и применили к нему декоратор login_
@@ -198,22 +196,51 @@ User и ProfileEditForm для хранения дополнительных п
 
 @login_required
 def user_list(request):
-    users = User.objects.filter(is_active=True)
+    # профиль загружается тем же запросом, из таблиц берутся
+    # только поля, которые использует шаблон
+    users = User.objects.filter(is_active=True) \
+        .select_related('profile') \
+        .only('id', 'username', 'first_name', 'last_name',
+              'profile__id', 'profile__photo')
+    paginator = KeysetPaginator(users, 24, ordering=('-id',))
+    cursor = request.GET.get('cursor')
+    users_only = request.GET.get('users_only')
+    try:
+        users = paginator.page(cursor)
+    except InvalidCursor:
+        if users_only:
+            return HttpResponse('')
+        users = paginator.page()
+    if users_only:
+        if not users:
+            return HttpResponse('')
+        response = render(request,
+                          'user/list_users.html',
+                          {'section': 'people',
+                           'users': users})
+        response['X-Next-Cursor'] = users.next_cursor or ''
+        return response
     return render(request,
-                  'account/user/list.html',
+                  'user/list.html',
                   {'section': 'people',
                    'users': users})
 
 
 @login_required
 def user_detail(request, username):
-    user = get_object_or_404(User,
+    user = get_object_or_404(User.objects.select_related('profile'),
                              username=username,
                              is_active=True)
+    # на странице выводится только первая страница изображений,
+    # остальные подгружаются при прокрутке
+    images_html, next_cursor = render_images_page(user.id)
     return render(request,
-                  'account/user/detail.html',
+                  'user/detail.html',
                   {'section': 'people',
-                   'user': user})
+                   'user': user,
+                   'images_html': images_html,
+                   'next_cursor': next_cursor,
+                   'is_following': is_following(request.user, user)})
 
 
 """
@@ -240,14 +267,38 @@ def user_follow(request):
         try:
             user = User.objects.get(id=user_id)
             if action == 'follow':
-                Contact.objects.get_or_create(
-                    user_from=request.user,
-                    user_to=user)
-                create_action(request.user, 'is following', user)
+                if follow_user(request.user, user):
+                    create_action(request.user, 'is following', user)
             else:
-                Contact.objects.filter(user_from=request.user,
-                                       user_to=user).delete()
+                unfollow_user(request.user, user)
+            # пересобрать ленту с учетом новых подписок
+            try:
+                rebuild_feed(request.user)
+            except redis.RedisError:
+                # подписка уже сохранена, лента будет пересобрана
+                # при следующем изменении подписок
+                logger.exception('Could not rebuild the feed of user %s',
+                                 request.user.id)
             return JsonResponse({'status': 'ok'})
         except User.DoesNotExist:
             return JsonResponse({'status': 'error'})
     return JsonResponse({'status': 'error'})
+
+
+@login_required
+def export(request):
+    export_format = request.GET.get('format', 'csv')
+    dataset = request.GET.get('data')
+    if export_format not in FORMATS or \
+            (dataset and dataset not in DATASETS):
+        return HttpResponseBadRequest('Unknown export format or data')
+    # ответ формируется по мере чтения строк из базы данных
+    response = StreamingHttpResponse(
+        stream_export(request.user, export_format, dataset),
+        content_type=FORMATS[export_format])
+    filename = f'{request.user.username}-{dataset or "bookmarks"}' \
+        f'.{export_format}'
+    if export_format == 'zip':
+        filename = f'{request.user.username}-export.zip'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
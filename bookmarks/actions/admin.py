@@ -1,8 +1,29 @@
 from django.contrib import admin
-from .models import Action
+from django.contrib.admin.views.main import ChangeList
+from .models import Action, ActionDailyRollup, prefetch_targets
+
+
+class ActionChangeList(ChangeList):
+    def get_results(self, request):
+        super().get_results(request)
+        # целевые объекты страницы загружаются пачкой, а не по одному
+        # запросу на строку
+        self.result_list = prefetch_targets(list(self.result_list))
+
 
 @admin.register(Action)
 class ActionAdmin(admin.ModelAdmin):
     list_display = ['user', 'verb', 'target', 'created']
     list_filter = ['created']
-    search_fields = ['verb']
\ No newline at end of file
+    search_fields = ['verb']
+    list_select_related = ['user']
+
+    def get_changelist(self, request, **kwargs):
+        return ActionChangeList
+
+
+@admin.register(ActionDailyRollup)
+class ActionDailyRollupAdmin(admin.ModelAdmin):
+    list_display = ['day', 'verb', 'target_ct', 'count']
+    list_filter = ['verb']
+    date_hierarchy = 'day'
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ActionsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "actions"
+
+    def ready(self):
+        # импортировать обработчики сигналов
+        from . import signals
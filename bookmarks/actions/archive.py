@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+from collections import Counter
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Action, ActionDailyRollup
+
+ARCHIVE_FIELDS = ['id', 'user_id', 'verb', 'created',
+                  'target_ct_id', 'target_id']
+
+
+def segment_path(directory, rows):
+    """
+    Имя сегмента определяется диапазоном ИД действий в нем, поэтому
+    повторная архивация тех же строк перезаписывает тот же файл.
+    """
+    return os.path.join(directory,
+                        f'actions-{rows[0]["id"]:012d}-'
+                        f'{rows[-1]["id"]:012d}.jsonl.gz')
+
+
+def write_segment(directory, rows):
+    """
+    Записать действия в сжатый файл JSONL и вернуть его путь.
+    Файл сначала пишется во временный и затем переименовывается,
+    чтобы в архиве не оставалось недописанных сегментов.
+    """
+    path = segment_path(directory, rows)
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as raw:
+        with gzip.open(raw, 'wt', encoding='utf-8') as f:
+            for row in rows:
+                row = dict(row, created=row['created'].isoformat())
+                f.write(json.dumps(row) + '\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp, path)
+    return path
+
+
+def read_segment(path):
+    """
+    Построчно читать действия из сегмента архива.
+    """
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+def add_to_rollups(rows):
+    """
+    Прибавить действия к дневным счетчикам ActionDailyRollup.
+    """
+    counts = Counter((timezone.localdate(row['created']), row['verb'],
+                      row['target_ct_id']) for row in rows)
+    for (day, verb, target_ct_id), count in counts.items():
+        updated = ActionDailyRollup.objects.filter(
+            day=day, verb=verb, target_ct_id=target_ct_id) \
+            .update(count=F('count') + count)
+        if not updated:
+            ActionDailyRollup.objects.create(day=day, verb=verb,
+                                             target_ct_id=target_ct_id,
+                                             count=count)
+
+
+def archive_chunk(cutoff, directory, chunk_size, after_id=0):
+    """
+    Архивировать не более chunk_size действий старше cutoff
+    с ИД больше after_id. Вернуть архивированные строки.
+    """
+    rows = list(Action.objects.filter(created__lt=cutoff, id__gt=after_id)
+                .order_by('id').values(*ARCHIVE_FIELDS)[:chunk_size])
+    if not rows:
+        return rows
+    write_segment(directory, rows)
+    # счетчики обновляются в одной транзакции с удалением, поэтому
+    # после сбоя строки не будут учтены дважды; короткая транзакция
+    # не блокирует таблицу надолго
+    with transaction.atomic():
+        add_to_rollups(rows)
+        Action.objects.filter(id__in=[row['id'] for row in rows]).delete()
+    return rows
+
+
+"""
+Действия нужны ленте и панели управления только за последние дни,
+поэтому команда archive_actions переносит действия старше
+ACTIONS_RETENTION_DAYS дней в сжатые файлы JSONL в каталоге
+ACTIONS_ARCHIVE_DIR и удаляет их из таблицы actions_action
+небольшими пачками. Таблица и индекс по полю created остаются
+небольшими, а число действий каждого вида за каждый день сохраняется
+в модели ActionDailyRollup. У действий нет зависимых объектов
+и обработчиков сигналов удаления, поэтому delete() удаляет пачку
+одним запросом DELETE без предварительной выборки объектов. ИД
+удаленных действий могут остаться в лентах redis - функция
+render_action_cards() их пропускает."""
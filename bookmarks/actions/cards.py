@@ -0,0 +1,103 @@
+import redis
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.timesince import timesince
+from account.authentication import user_version_key
+from bookmarks.versions import get_versions
+from .models import Action, prefetch_targets
+
+# подставляется вместо относительного времени при рендеринге карточки
+TIMESINCE_PLACEHOLDER = '__timesince__'
+
+
+def card_key(action_id):
+    return f'actions:card:{action_id}'
+
+
+def target_version_key(label, target_id):
+    if label == 'auth.user':
+        # карточка показывает имя пользователя, как и кеш request.user
+        return user_version_key(target_id)
+    return f'actions:target:{label}:{target_id}:version'
+
+
+def _dependencies(action):
+    """
+    Ключи версий данных, которые выводит карточка действия.
+    """
+    keys = [user_version_key(action.user_id)]
+    if action.target_ct_id and action.target_id:
+        label = ContentType.objects.get_for_id(action.target_ct_id) \
+            .model_class()._meta.label_lower
+        keys.append(target_version_key(label, action.target_id))
+    return keys
+
+
+def _render(actions):
+    versions = {}
+    for action in actions:
+        versions.update(dict.fromkeys(_dependencies(action)))
+    versions = dict(zip(versions, get_versions(*versions)))
+    cards = {}
+    for action in actions:
+        html = render_to_string('actions/action/detail.html',
+                                {'action': action,
+                                 'timesince': TIMESINCE_PLACEHOLDER})
+        cards[action.id] = {
+            'html': html,
+            'created': action.created,
+            'versions': {key: versions[key]
+                         for key in _dependencies(action)},
+        }
+    return cards
+
+
+def render_action_cards(action_ids):
+    """
+    Вернуть HTML карточек действий в порядке action_ids. Карточки
+    берутся из кеша, заново рендерятся только отсутствующие и те,
+    у которых изменился пользователь или целевой объект.
+    """
+    try:
+        cached = cache.get_many([card_key(action_id)
+                                 for action_id in action_ids])
+        keys = {key for card in cached.values() for key in card['versions']}
+        current = dict(zip(keys, get_versions(*keys)))
+    except redis.RedisError:
+        cached = current = None
+    cards = {}
+    for action_id in action_ids:
+        card = (cached or {}).get(card_key(action_id))
+        if card is not None and all(current[key] == version for key, version
+                                    in card['versions'].items()):
+            cards[action_id] = card
+    missing = [action_id for action_id in action_ids
+               if action_id not in cards]
+    if missing:
+        actions = Action.objects.filter(id__in=missing) \
+            .select_related('user', 'user__profile')
+        rendered = _render(prefetch_targets(list(actions)))
+        cards.update(rendered)
+        if cached is not None:
+            try:
+                cache.set_many({card_key(action_id): card
+                                for action_id, card in rendered.items()},
+                               settings.ACTIONS_CARD_CACHE_TTL)
+            except redis.RedisError:
+                pass
+    # относительное время вычисляется при каждом запросе
+    return [cards[action_id]['html'].replace(
+                TIMESINCE_PLACEHOLDER, timesince(cards[action_id]['created']), 1)
+            for action_id in action_ids if action_id in cards]
+
+
+"""
+Действие не изменяется после создания, поэтому его карточка рендерится
+один раз и хранится в кеше по ИД действия. Вместе с HTML сохраняются
+номера версий пользователя, выполнившего действие, и целевого объекта;
+если при чтении версия отличается (пользователь изменил профиль,
+изображение отредактировано или для него сгенерированы миниатюры),
+карточка рендерится заново. Относительное время ("5 minutes ago")
+подставляется вместо метки __timesince__ при каждом запросе."""
@@ -0,0 +1,83 @@
+from collections import defaultdict
+from django.conf import settings
+from bookmarks.redis_client import get_redis, pipeline
+from account.models import Contact
+from .models import Action
+
+# сколько подписчиков обрабатывать за один конвейер redis
+FANOUT_CHUNK_SIZE = 500
+
+
+def feed_key(user_id):
+    return f'user:{user_id}:feed'
+
+
+def _score(action):
+    return action.created.timestamp()
+
+
+def push_actions(follower_ids, actions):
+    """
+    Добавить действия в ленты указанных подписчиков
+    и обрезать каждую ленту до ACTIONS_FEED_LENGTH элементов.
+    """
+    mapping = {action.id: _score(action) for action in actions}
+    if not mapping:
+        return
+    pipe = pipeline()
+    for follower_id in follower_ids:
+        key = feed_key(follower_id)
+        pipe.zadd(key, mapping)
+        pipe.zremrangebyrank(key, 0, -settings.ACTIONS_FEED_LENGTH - 1)
+    pipe.execute()
+
+
+def fan_out(actions):
+    """
+    Разослать действия в ленты всех подписчиков их авторов.
+    """
+    by_user = defaultdict(list)
+    for action in actions:
+        by_user[action.user_id].append(action)
+    for user_id, user_actions in by_user.items():
+        follower_ids = Contact.objects.filter(user_to_id=user_id) \
+            .values_list('user_from_id', flat=True)
+        chunk = []
+        for follower_id in follower_ids.iterator(
+                chunk_size=FANOUT_CHUNK_SIZE):
+            chunk.append(follower_id)
+            if len(chunk) >= FANOUT_CHUNK_SIZE:
+                push_actions(chunk, user_actions)
+                chunk = []
+        if chunk:
+            push_actions(chunk, user_actions)
+
+
+def get_feed_ids(user, count=10):
+    """
+    Вернуть ИД последних count действий из ленты пользователя
+    в порядке от новых к старым.
+    """
+    return [int(action_id) for action_id in
+            get_redis().zrevrange(feed_key(user.id), 0, count - 1)]
+
+
+def rebuild_feed(user):
+    """
+    Заново заполнить ленту пользователя последними действиями
+    пользователей, на которых он подписан.
+    """
+    following_ids = user.following.values_list('id', flat=True)
+    actions = Action.objects.filter(user_id__in=following_ids) \
+        .only('id', 'created')[:settings.ACTIONS_FEED_LENGTH]
+    get_redis().delete(feed_key(user.id))
+    push_actions([user.id], actions)
+
+
+"""
+Лента действий строится по принципу fan-out-on-write: при создании
+действия его ИД добавляется в сортированное множество redis каждого
+подписчика автора с оценкой, равной времени создания действия. Длина
+каждой ленты ограничивается параметром ACTIONS_FEED_LENGTH, поэтому
+чтение ленты стоит одинаково независимо от размера таблицы actions_action:
+одна команда ZREVRANGE и один запрос к базе данных по первичным ключам."""
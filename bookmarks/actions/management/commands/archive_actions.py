@@ -0,0 +1,46 @@
+import os
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from actions.archive import archive_chunk
+
+
+class Command(BaseCommand):
+    help = 'Перенести старые действия в архив JSONL и удалить их из таблицы'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            default=settings.ACTIONS_RETENTION_DAYS,
+                            help='Сколько дней хранить действия в таблице')
+        parser.add_argument('--directory',
+                            default=settings.ACTIONS_ARCHIVE_DIR,
+                            help='Каталог для сегментов архива')
+        parser.add_argument('--chunk-size', type=int,
+                            default=settings.ACTIONS_ARCHIVE_CHUNK_SIZE,
+                            help='Сколько действий удалять за одну '
+                                 'транзакцию')
+        parser.add_argument('--pause', type=float, default=0.1,
+                            help='Пауза между пачками, с')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        directory = options['directory']
+        os.makedirs(directory, exist_ok=True)
+        self.stdout.write(f'Archiving actions created before '
+                          f'{cutoff:%Y-%m-%d %H:%M} to {directory}')
+        total = 0
+        last_id = 0
+        while True:
+            rows = archive_chunk(cutoff, directory, options['chunk_size'],
+                                 after_id=last_id)
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            total += len(rows)
+            self.stdout.write(f'Archived {total} action(s), '
+                              f'last id {last_id}')
+            # пауза дает место обычным запросам на запись
+            time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} action(s)'))
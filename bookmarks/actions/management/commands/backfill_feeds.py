@@ -0,0 +1,24 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from actions.feed import rebuild_feed
+
+
+class Command(BaseCommand):
+    help = 'Заполнить ленты действий пользователей из таблицы действий'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*',
+                            help='Пересобрать ленты только этих пользователей')
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        else:
+            # ленты нужны только тем, кто на кого-либо подписан
+            users = users.filter(rel_from_set__isnull=False).distinct()
+        total = 0
+        for user in users.only('id').iterator(chunk_size=500):
+            rebuild_feed(user)
+            total += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {total} feed(s)'))
@@ -1,7 +1,40 @@
+from collections import defaultdict
 from django.db import models
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
 
+# связанные объекты, которые шаблоны используют у целевых объектов
+TARGET_SELECT_RELATED = {
+    'auth.user': ['profile'],
+}
+
+
+def prefetch_targets(actions):
+    """
+    Загрузить целевые объекты действий одним запросом IN
+    на каждый тип содержимого.
+    """
+    ids_by_ct = defaultdict(set)
+    for action in actions:
+        if action.target_ct_id and action.target_id:
+            ids_by_ct[action.target_ct_id].add(action.target_id)
+    targets = {}
+    for ct_id, ids in ids_by_ct.items():
+        model = ContentType.objects.get_for_id(ct_id).model_class()
+        if model is None:
+            continue
+        queryset = model._base_manager.filter(pk__in=ids)
+        related = TARGET_SELECT_RELATED.get(model._meta.label_lower)
+        if related:
+            queryset = queryset.select_related(*related)
+        targets[ct_id] = {obj.pk: obj for obj in queryset}
+    target_field = Action._meta.get_field('target')
+    for action in actions:
+        target = targets.get(action.target_ct_id, {}).get(action.target_id)
+        if target is not None:
+            target_field.set_cached_value(action, target)
+    return actions
+
 
 class Action(models.Model):
     user = models.ForeignKey('auth.User',
@@ -26,6 +59,29 @@ class Action(models.Model):
         ordering = ['-created']
 
 
+class ActionDailyRollup(models.Model):
+    """
+    Число действий каждого вида за день. Заполняется при архивации
+    старых действий (actions.archive), поэтому статистика за прошлые
+    дни сохраняется после их удаления из actions_action.
+    """
+    day = models.DateField()
+    verb = models.CharField(max_length=255)
+    target_ct = models.ForeignKey(ContentType,
+                                  blank=True,
+                                  null=True,
+                                  related_name='+',
+                                  on_delete=models.CASCADE)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'verb', 'target_ct'],
+                                    name='actions_rollup_day_verb_ct'),
+        ]
+        ordering = ['-day', 'verb']
+
+
 """
 В приведенном выше исходном коде показана модель Action, которая бу-
 дет использоваться для хранения действий пользователя. Поля этой модели
@@ -52,6 +108,12 @@ X подписан на пользователя Y. Как вы уже знае
 • target: поле GenericForeignKey для связанного объекта на основе комби-
 нации двух предыдущих полей.
 Кроме того, был добавлен многопольный индекс, включающий поля target_
-ct и target_id."""
+ct и target_id.
+Функция prefetch_targets() загружает целевые объекты списка действий
+одним запросом на каждый тип содержимого вместе со связанными
+объектами из TARGET_SELECT_RELATED, например профилем пользователя,
+поэтому число запросов не зависит от числа действий. Ее вызывают там,
+где выводится список действий: при рендеринге карточек и в списке
+действий сайта администрирования."""
 
 
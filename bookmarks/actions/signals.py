@@ -0,0 +1,20 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from account.authentication import user_version_key
+from account.models import Profile
+from bookmarks.versions import bump_version
+from images.models import Image
+from images.thumbnails import thumbnails_generated
+from .cards import target_version_key
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+@receiver(thumbnails_generated, sender=Image)
+def image_changed(sender, instance, **kwargs):
+    bump_version(target_version_key('images.image', instance.pk))
+
+
+@receiver(thumbnails_generated, sender=Profile)
+def profile_thumbnails_generated(sender, instance, **kwargs):
+    bump_version(user_version_key(instance.user_id))
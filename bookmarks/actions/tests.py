@@ -1,3 +1,197 @@
-from django.test import TestCase
+import io
+import os
+import tempfile
+from datetime import timedelta
+from unittest import mock
+import redis
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import call_command
+from django.test import override_settings
+from django.utils import timezone
+from account.models import Contact
+from bookmarks.testing import MemoryRedisTestCase
+from images.models import Image
+from .cards import TIMESINCE_PLACEHOLDER, render_action_cards
+from .archive import archive_chunk, read_segment
+from .feed import fan_out, get_feed_ids, rebuild_feed
+from .models import Action, ActionDailyRollup
+from .utils import LocalDedupWindow, action_buffer, claim_action, \
+    create_action
 
-# Create your tests here.
+
+class ArchiveTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.user = User.objects.create_user('alice')
+        self.other = User.objects.create_user('bob')
+        user_ct = ContentType.objects.get_for_model(User)
+        self.now = timezone.now()
+        self.old = []
+        for days in (100, 100, 120):
+            self.old.append(self.create(days, 'is following',
+                                        target_ct=user_ct,
+                                        target_id=self.other.id))
+        self.old.append(self.create(100, 'has created an account'))
+        self.recent = self.create(1, 'has created an account')
+
+    def create(self, days, verb, **fields):
+        action = Action.objects.create(user=self.user, verb=verb, **fields)
+        # created заполняется автоматически, поэтому дата задается отдельно
+        Action.objects.filter(id=action.id) \
+            .update(created=self.now - timedelta(days=days))
+        return action
+
+    def segments(self):
+        return sorted(os.path.join(self.directory.name, name)
+                      for name in os.listdir(self.directory.name))
+
+    def test_archive_chunk(self):
+        cutoff = self.now - timedelta(days=90)
+        rows = archive_chunk(cutoff, self.directory.name, 3)
+        self.assertEqual([row['id'] for row in rows],
+                         [action.id for action in self.old[:3]])
+        rows += archive_chunk(cutoff, self.directory.name, 3,
+                              after_id=rows[-1]['id'])
+        self.assertEqual(archive_chunk(cutoff, self.directory.name, 3,
+                                       after_id=rows[-1]['id']), [])
+        # в таблице осталось только новое действие
+        self.assertEqual(list(Action.objects.values_list('id', flat=True)),
+                         [self.recent.id])
+        archived = [row for path in self.segments()
+                    for row in read_segment(path)]
+        self.assertEqual([row['id'] for row in archived],
+                         [action.id for action in self.old])
+        self.assertEqual(archived[0]['verb'], 'is following')
+        self.assertEqual(archived[0]['target_id'], self.other.id)
+
+    def test_rollups(self):
+        call_command('archive_actions', directory=self.directory.name,
+                     days=90, chunk_size=2, pause=0, stdout=io.StringIO())
+        rollups = {(rollup.day, rollup.verb): rollup.count
+                   for rollup in ActionDailyRollup.objects.all()}
+        day_100 = timezone.localdate(self.now - timedelta(days=100))
+        day_120 = timezone.localdate(self.now - timedelta(days=120))
+        self.assertEqual(rollups, {
+            (day_100, 'is following'): 2,
+            (day_120, 'is following'): 1,
+            (day_100, 'has created an account'): 1,
+        })
+        self.assertEqual(len(self.segments()), 2)
+        self.assertFalse(any(path.endswith('.tmp')
+                             for path in self.segments()))
+
+
+class DedupTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('carol')
+        self.other = User.objects.create_user('dave')
+
+    def test_claim_action(self):
+        self.assertTrue(claim_action('action:dedup:test'))
+        self.assertFalse(claim_action('action:dedup:test'))
+        self.assertTrue(claim_action('action:dedup:other'))
+
+    def test_create_action_once_per_window(self):
+        self.assertTrue(create_action(self.user, 'is following', self.other))
+        self.assertFalse(create_action(self.user, 'is following',
+                                       self.other))
+        self.assertTrue(create_action(self.user, 'has created an account'))
+        self.assertEqual(Action.objects.count(), 2)
+
+    def test_local_window_without_redis(self):
+        with mock.patch('actions.utils.get_redis',
+                        side_effect=redis.ConnectionError), \
+                mock.patch('actions.utils.local_dedup', LocalDedupWindow()), \
+                self.assertLogs('actions.utils', 'WARNING'):
+            self.assertTrue(claim_action('action:dedup:test'))
+            self.assertFalse(claim_action('action:dedup:test'))
+
+    def test_local_window_expires(self):
+        window = LocalDedupWindow()
+        self.assertTrue(window.claim('key', 60))
+        self.assertFalse(window.claim('key', 60))
+        self.assertTrue(window.claim('expired', 0))
+        self.assertTrue(window.claim('expired', 0))
+
+    @override_settings(ACTIONS_FLUSH_INTERVAL=60)
+    def test_buffered_actions(self):
+        # интервал читается при добавлении, поэтому действие ждет сброса
+        self.addCleanup(action_buffer.flush)
+        create_action(self.user, 'has created an account')
+        self.assertFalse(Action.objects.exists())
+        action_buffer.flush()
+        self.assertEqual(Action.objects.count(), 1)
+
+
+@override_settings(ACTIONS_FEED_LENGTH=3)
+class FeedTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user('erin')
+        self.followers = [User.objects.create_user(f'follower{i}')
+                          for i in range(3)]
+        self.stranger = User.objects.create_user('frank')
+        for follower in self.followers:
+            Contact.objects.create(user_from=follower, user_to=self.author)
+        now = timezone.now()
+        for i in range(5):
+            action = Action.objects.create(user=self.author, verb=f'verb {i}')
+            Action.objects.filter(id=action.id) \
+                .update(created=now - timedelta(minutes=i))
+        self.actions = list(Action.objects.order_by('created'))
+        # новые действия первыми, как их показывает лента
+        self.latest = [action.id for action in reversed(self.actions)][:3]
+
+    def test_feed_is_capped(self):
+        with mock.patch('actions.feed.FANOUT_CHUNK_SIZE', 2):
+            fan_out(self.actions[:2])
+            fan_out(self.actions[2:])
+        for follower in self.followers:
+            self.assertEqual(get_feed_ids(follower, 10), self.latest)
+        self.assertEqual(get_feed_ids(self.stranger, 10), [])
+
+    def test_rebuild_feed(self):
+        follower = self.followers[0]
+        rebuild_feed(follower)
+        self.assertEqual(get_feed_ids(follower, 10), self.latest)
+        rebuild_feed(self.stranger)
+        self.assertEqual(get_feed_ids(self.stranger, 10), [])
+
+
+class ActionCardTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('hank', first_name='Hank')
+        self.image = Image.objects.create(user=self.user, title='Old title',
+                                          url='https://example.com/1.png')
+        self.action = Action.objects.create(user=self.user, verb='likes',
+                                            target=self.image)
+
+    def render(self):
+        html, = render_action_cards([self.action.id])
+        return html
+
+    def test_card_is_cached(self):
+        html = self.render()
+        self.assertIn('Old title', html)
+        self.assertNotIn(TIMESINCE_PLACEHOLDER, html)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.render(), html)
+
+    def test_renamed_target_invalidates_card(self):
+        self.render()
+        self.image.title = 'New title'
+        self.image.save()
+        html = self.render()
+        self.assertIn('New title', html)
+        self.assertNotIn('Old title', html)
+
+    def test_changed_user_invalidates_card(self):
+        self.render()
+        self.user.first_name = 'Henry'
+        self.user.save()
+        self.assertIn('Henry', self.render())
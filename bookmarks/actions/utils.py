@@ -1,27 +1,121 @@
+import logging
+import threading
+import time
+import redis
+from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
-from .models import Action
-import datetime
+from django.db import close_old_connections, connection
 from django.utils import timezone
+from bookmarks.buffers import PeriodicBuffer
+from .models import Action
+from bookmarks.redis_client import get_redis
+from .feed import fan_out
+
+logger = logging.getLogger(__name__)
+
+
+class LocalDedupWindow:
+    """
+    Замена redis для окна устранения повторов, если redis недоступен.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.expires = {}
+
+    def claim(self, key, timeout):
+        now = time.monotonic()
+        with self.lock:
+            if self.expires.get(key, 0) > now:
+                return False
+            if len(self.expires) > 10000:
+                self.expires = {k: v for k, v in self.expires.items()
+                                if v > now}
+            self.expires[key] = now + timeout
+            return True
+
+
+local_dedup = LocalDedupWindow()
+
+
+def claim_action(key):
+    """
+    Атомарно занять ключ на время окна ACTIONS_DEDUP_WINDOW.
+    Вернуть False, если такое действие уже было совершено.
+    """
+    timeout = settings.ACTIONS_DEDUP_WINDOW
+    try:
+        return bool(get_redis().set(key, 1, nx=True, ex=timeout))
+    except redis.RedisError:
+        logger.warning('Redis unavailable, using local dedup window')
+        return local_dedup.claim(key, timeout)
+
+
+class ActionBuffer(PeriodicBuffer):
+    """
+    Накапливает новые действия и записывает их пачкой через bulk_create.
+    """
+
+    interval_setting = 'ACTIONS_FLUSH_INTERVAL'
+    size_setting = 'ACTIONS_FLUSH_SIZE'
+
+    def __init__(self):
+        super().__init__()
+        self.actions = []
+
+    def add(self, action):
+        if self.interval <= 0:
+            self.write([action])
+            return
+        with self.lock:
+            self.actions.append(action)
+            size = len(self.actions)
+        self.added(size)
+
+    def drain(self):
+        actions, self.actions = self.actions, []
+        return actions
+
+    def write(self, actions):
+        try:
+            if connection.features.can_return_rows_from_bulk_insert:
+                Action.objects.bulk_create(actions)
+            else:
+                # без ИД новых строк действия нельзя добавить в ленты
+                for action in actions:
+                    action.save()
+            # добавить действия в ленты подписчиков; действия уже
+            # сохранены, поэтому ошибка redis не должна доходить
+            # до запроса, создавшего действие
+            try:
+                fan_out(actions)
+            except redis.RedisError:
+                logger.exception('Could not add %s action(s) to feeds',
+                                 len(actions))
+        finally:
+            if threading.current_thread() is self.thread:
+                close_old_connections()
+
+
+action_buffer = ActionBuffer()
 
 
 def create_action(user, verb, target=None):
     # Проверяем, не было ли каких-либо аналогичных действий,
     # совершенных за последнюю минуту
-    now = timezone.now()
-    last_minute = now - datetime.timedelta(seconds=60)
-    similar_actions = Action.objects.filter(user=user,
-                                            verb=verb,
-                                            created__gte=last_minute)
+    target_ct = target_id = None
     if target:
         target_ct = ContentType.objects.get_for_model(target)
-        similar_actions = similar_actions.filter(target_content_type=target_ct,
-                                                 target_object_id=target.id)
-    if not similar_actions.exists():
-        # Никаких существующих действий не найдено, создаем новое действие
-        action = Action(user=user, verb=verb, target=target)
-        action.save()
-        return True
-    return False
+        target_id = target.id
+    key = f'action:dedup:{user.id}:{verb}:' \
+          f'{target_ct.id if target_ct else ""}:{target_id or ""}'
+    if not claim_action(key):
+        return False
+    # Никаких существующих действий не найдено, создаем новое действие
+    action_buffer.add(Action(user=user, verb=verb,
+                             target_ct=target_ct, target_id=target_id,
+                             created=timezone.now()))
+    return True
 
 
 """
@@ -40,6 +134,10 @@ def create_action(user, verb, target=None):
 ствий, выполненных пользователем с тех пор;
 3) если за последнюю минуту не было идентичного действия, то создается
 объект Action. При этом возвращается True, если объект Action был соз-
-дан, либо False в противном случае."""
-
-
+дан, либо False в противном случае.
+Окно в одну минуту теперь хранится в redis: ключ user/verb/target
+занимается атомарной командой SET NX EX, поэтому одновременные запросы
+не создают повторов, а проверка не выполняет запрос к базе данных.
+Если redis недоступен, используется окно в памяти процесса. Принятые
+действия записываются пачками через bulk_create раз в
+ACTIONS_FLUSH_INTERVAL секунд."""
@@ -0,0 +1,78 @@
+import atexit
+import logging
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicBuffer:
+    """
+    Накапливает записи в памяти процесса и сбрасывает их пакетом
+    в фоновом потоке раз в interval секунд либо как только
+    в буфере наберется max_size записей.
+    """
+
+    # имена настроек с интервалом и размером пакета; настройки читаются
+    # при каждом обращении, поэтому их можно менять через override_settings
+    interval_setting = None
+    size_setting = None
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.thread = None
+        atexit.register(self.flush)
+
+    @property
+    def interval(self):
+        return getattr(settings, self.interval_setting)
+
+    @property
+    def max_size(self):
+        return getattr(settings, self.size_setting)
+
+    def _start(self):
+        # поток запускается лениво, уже в рабочем процессе сервера
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self._loop,
+                                           name=type(self).__name__,
+                                           daemon=True)
+            self.thread.start()
+
+    def _loop(self):
+        while True:
+            interval = self.interval
+            # при нулевом интервале поток ждет только заполнения буфера
+            self.wakeup.wait(interval if interval > 0 else None)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('%s flush failed', type(self).__name__)
+
+    def added(self, size):
+        """
+        Вызывается подклассом после добавления записи
+        с текущим размером буфера.
+        """
+        self._start()
+        if size >= self.max_size:
+            self.wakeup.set()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch = self.drain()
+            if batch:
+                self.write(batch)
+
+    def drain(self):
+        """
+        Забрать накопленные записи. Вызывается под self.lock.
+        """
+        raise NotImplementedError
+
+    def write(self, batch):
+        raise NotImplementedError
@@ -0,0 +1,285 @@
+import bisect
+import contextvars
+import heapq
+import logging
+import threading
+import time
+from contextlib import ExitStack
+from django.conf import settings
+from django.db import connections
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+from django.template.backends.django import DjangoTemplates, Template
+from django.utils.crypto import constant_time_compare
+from easy_thumbnails.signals import thumbnail_created
+from .redis_client import stats as redis_stats
+
+logger = logging.getLogger(__name__)
+
+# границы интервалов гистограмм, с
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+           2.5, 5.0, 10.0)
+# сколько самых долгих запросов к базе данных выводить в журнал
+SLOW_QUERIES_SHOWN = 5
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """
+    Показатели одного HTTP-запроса.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.redis_commands = 0
+        self.redis_time = 0.0
+        self.render_time = 0.0
+        # SLOW_QUERIES_SHOWN самых долгих запросов: (время, SQL)
+        self.slowest = []
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.query_time += elapsed
+            if len(self.slowest) < SLOW_QUERIES_SHOWN:
+                heapq.heappush(self.slowest, (elapsed, sql))
+            elif elapsed > self.slowest[0][0]:
+                heapq.heapreplace(self.slowest, (elapsed, sql))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+class ViewMetrics:
+    """
+    Накопленные показатели одного представления.
+    """
+
+    def __init__(self):
+        self.responses = {}
+        self.duration = Histogram()
+        self.query_time = Histogram()
+        self.redis_time = Histogram()
+        self.render_time = Histogram()
+        self.queries = 0
+        self.redis_commands = 0
+
+    def add(self, status, duration, metrics):
+        self.responses[status] = self.responses.get(status, 0) + 1
+        self.duration.observe(duration)
+        self.query_time.observe(metrics.query_time)
+        self.redis_time.observe(metrics.redis_time)
+        self.render_time.observe(metrics.render_time)
+        self.queries += metrics.queries
+        self.redis_commands += metrics.redis_commands
+
+
+class Registry:
+    """
+    Гистограммы и счетчики в памяти процесса. Обновление выполняется
+    один раз за запрос под одной блокировкой.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.thumbnails = 0
+
+    def add(self, view, status, duration, metrics):
+        with self.lock:
+            view_metrics = self.views.get(view)
+            if view_metrics is None:
+                view_metrics = self.views[view] = ViewMetrics()
+            view_metrics.add(status, duration, metrics)
+
+    def thumbnail_created(self):
+        with self.lock:
+            self.thumbnails += 1
+
+    def render(self):
+        """
+        Вернуть показатели в текстовом формате Prometheus.
+        """
+        with self.lock:
+            lines = []
+            histograms = [
+                ('request_duration_seconds', 'duration',
+                 'Request processing time'),
+                ('db_duration_seconds', 'query_time',
+                 'Time spent in SQL queries per request'),
+                ('redis_duration_seconds', 'redis_time',
+                 'Time spent in Redis commands per request'),
+                ('template_render_seconds', 'render_time',
+                 'Time spent rendering templates per request'),
+            ]
+            for name, attr, help_text in histograms:
+                lines += [f'# HELP bookmarks_{name} {help_text}',
+                          f'# TYPE bookmarks_{name} histogram']
+                for view, view_metrics in sorted(self.views.items()):
+                    histogram = getattr(view_metrics, attr)
+                    total = 0
+                    for bound, count in zip(BUCKETS + ('+Inf',),
+                                            histogram.counts):
+                        total += count
+                        lines.append(f'bookmarks_{name}_bucket'
+                                     f'{{view="{view}",le="{bound}"}} {total}')
+                    lines.append(f'bookmarks_{name}_sum{{view="{view}"}} '
+                                 f'{histogram.sum}')
+                    lines.append(f'bookmarks_{name}_count{{view="{view}"}} '
+                                 f'{total}')
+            counters = [
+                ('db_queries_total', 'queries', 'SQL queries executed'),
+                ('redis_commands_total', 'redis_commands',
+                 'Redis commands sent'),
+            ]
+            for name, attr, help_text in counters:
+                lines += [f'# HELP bookmarks_{name} {help_text}',
+                          f'# TYPE bookmarks_{name} counter']
+                for view, view_metrics in sorted(self.views.items()):
+                    lines.append(f'bookmarks_{name}{{view="{view}"}} '
+                                 f'{getattr(view_metrics, attr)}')
+            lines += ['# HELP bookmarks_responses_total HTTP responses',
+                      '# TYPE bookmarks_responses_total counter']
+            for view, view_metrics in sorted(self.views.items()):
+                for status, count in sorted(view_metrics.responses.items()):
+                    lines.append(f'bookmarks_responses_total'
+                                 f'{{view="{view}",status="{status}"}} '
+                                 f'{count}')
+            lines += ['# HELP bookmarks_thumbnails_total Thumbnails generated',
+                      '# TYPE bookmarks_thumbnails_total counter',
+                      f'bookmarks_thumbnails_total {self.thumbnails}']
+        commands, round_trips = redis_stats.snapshot()
+        lines += ['# HELP bookmarks_redis_process_commands_total Redis '
+                  'commands sent by the process, including background flushes',
+                  '# TYPE bookmarks_redis_process_commands_total counter',
+                  f'bookmarks_redis_process_commands_total {commands}',
+                  '# HELP bookmarks_redis_process_round_trips_total Redis '
+                  'round trips made by the process',
+                  '# TYPE bookmarks_redis_process_round_trips_total counter',
+                  f'bookmarks_redis_process_round_trips_total {round_trips}']
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+
+class MetricsMiddleware:
+    """
+    Собирает показатели каждого запроса: число и время SQL-запросов,
+    число и время команд redis и время рендеринга шаблонов. Медленные запросы записываются в журнал.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        redis_token = redis_stats.tracker.set(metrics)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(metrics.record_query))
+                response = self.get_response(request)
+        finally:
+            duration = time.perf_counter() - start
+            redis_stats.tracker.reset(redis_token)
+            _current.reset(token)
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        registry.add(view, response.status_code, duration, metrics)
+        if duration >= settings.METRICS_SLOW_REQUEST:
+            self.log_slow_request(request, view, duration, metrics)
+        return response
+
+    def log_slow_request(self, request, view, duration, metrics):
+        queries = '\n'.join(f'  {elapsed * 1000:.1f} ms: {sql}'
+                            for elapsed, sql in
+                            sorted(metrics.slowest, reverse=True))
+        logger.warning(
+            'Slow request %s %s (%s): %.1f ms, %s queries in %.1f ms, '
+            '%s redis commands in %.1f ms, render %.1f ms\n%s',
+            request.method, request.path, view, duration * 1000,
+            metrics.queries, metrics.query_time * 1000,
+            metrics.redis_commands, metrics.redis_time * 1000,
+            metrics.render_time * 1000, queries)
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.render_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """
+    Бэкенд шаблонов Django, который учитывает время рендеринга.
+    """
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code),
+                                    self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+@receiver(thumbnail_created)
+def count_thumbnail(sender, **kwargs):
+    # миниатюры создаются в фоновых потоках, поэтому считаются
+    # для всего процесса, а не для представления
+    registry.thumbnail_created()
+
+
+def metrics_view(request):
+    """
+    Показатели в текстовом формате Prometheus. Доступны только
+    с адресов из METRICS_ALLOWED_IPS и, если задан METRICS_TOKEN,
+    только с этим токеном в заголовке Authorization.
+    """
+    if request.META.get('REMOTE_ADDR') not in settings.METRICS_ALLOWED_IPS:
+        return HttpResponseForbidden()
+    if settings.METRICS_TOKEN and not constant_time_compare(
+            request.headers.get('Authorization', ''),
+            f'Bearer {settings.METRICS_TOKEN}'):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(),
+                        content_type='text/plain; version=0.0.4')
+
+
+"""
+Показатели собираются постоянно, поэтому на каждый запрос приходится
+лишь несколько вызовов perf_counter() и одно обновление гистограмм
+под блокировкой. SQL-запросы учитываются через
+connection.execute_wrapper(), команды redis - в CountingConnection
+(bookmarks.redis_client), время рендеринга - бэкендом шаблонов
+InstrumentedDjangoTemplates. Миниатюры создаются в фоновых потоках,
+поэтому сигнал thumbnail_created из easy_thumbnails учитывается
+в общем счетчике процесса. Показатели каждого процесса собирает
+Prometheus с адреса /metrics/; за обратным прокси все запросы приходят
+с его адреса, поэтому доступ нужно ограничить токеном METRICS_TOKEN
+или закрыть /metrics/ в самом прокси. Запросы дольше
+METRICS_SLOW_REQUEST секунд записываются в журнал вместе с самыми
+долгими SQL-запросами."""
@@ -0,0 +1,83 @@
+import base64
+import json
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Постраничная разбивка по ключу (курсору) вместо OFFSET.
+    Последнее поле в ordering должно быть уникальным, например id.
+    """
+
+    def __init__(self, object_list, per_page, ordering=('-created', '-id')):
+        self.object_list = object_list.order_by(*ordering)
+        self.per_page = per_page
+        self.ordering = ordering
+        self.fields = [self._get_field(name.lstrip('-'))
+                       for name in ordering]
+
+    def _get_field(self, name):
+        return self.object_list.model._meta.get_field(name)
+
+    def encode_cursor(self, obj):
+        values = [field.value_to_string(obj) for field in self.fields]
+        data = json.dumps(values, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(cursor + padding))
+            if len(values) != len(self.fields):
+                raise ValueError
+            return [field.to_python(value)
+                    for field, value in zip(self.fields, values)]
+        except Exception:
+            raise InvalidCursor(cursor)
+
+    def _after(self, values):
+        # (a, b) < (x, y)  ->  a < x OR (a = x AND b < y)
+        condition = Q()
+        equal = {}
+        for name, value in zip(self.ordering, values):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            name = name.lstrip('-')
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
+
+    def page(self, cursor=None):
+        """
+        Вернуть страницу, следующую за курсором, без подсчета
+        общего числа объектов.
+        """
+        object_list = self.object_list
+        if cursor:
+            object_list = object_list.filter(
+                self._after(self.decode_cursor(cursor)))
+        # взять на один объект больше, чтобы узнать, есть ли продолжение
+        objects = list(object_list[:self.per_page + 1])
+        next_cursor = None
+        if len(objects) > self.per_page:
+            objects = objects[:self.per_page]
+            next_cursor = self.encode_cursor(objects[-1])
+        return KeysetPage(objects, next_cursor)
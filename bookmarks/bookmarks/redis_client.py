@@ -0,0 +1,476 @@
+import contextvars
+import fnmatch
+import functools
+import threading
+import time
+import redis
+from django.conf import settings
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class RedisStats:
+    """
+    Счетчики отправленных команд redis, сетевых обменов с сервером
+    и времени ожидания ответов. Если в текущем контексте установлен
+    объект tracker (см. bookmarks.metrics), команды и время
+    учитываются и в нем.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = 0
+        self.round_trips = 0
+        self.seconds = 0.0
+        self.tracker = contextvars.ContextVar('redis_tracker', default=None)
+
+    def record(self, commands, round_trips=1):
+        with self.lock:
+            self.commands += commands
+            self.round_trips += round_trips
+        tracker = self.tracker.get()
+        if tracker is not None:
+            tracker.redis_commands += commands
+
+    def record_time(self, seconds):
+        with self.lock:
+            self.seconds += seconds
+        tracker = self.tracker.get()
+        if tracker is not None:
+            tracker.redis_time += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return self.commands, self.round_trips
+
+
+stats = RedisStats()
+
+
+class CountingConnection(redis.Connection):
+    """
+    Соединение, которое учитывает команды в stats.
+    """
+
+    def pack_command(self, *args):
+        stats.record(1)
+        return super().pack_command(*args)
+
+    def pack_commands(self, commands):
+        commands = list(commands)
+        stats.record(len(commands))
+        return super().pack_commands(commands)
+
+    def send_packed_command(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().send_packed_command(*args, **kwargs)
+        finally:
+            stats.record_time(time.perf_counter() - start)
+
+    def read_response(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super().read_response(*args, **kwargs)
+        finally:
+            stats.record_time(time.perf_counter() - start)
+
+
+class CountingConnectionPool(redis.ConnectionPool):
+    """
+    Пул соединений CountingConnection. Используется и клиентом проекта,
+    и кешем Django (параметр pool_class в CACHES).
+    """
+
+    def __init__(self, connection_class=CountingConnection, **kwargs):
+        super().__init__(connection_class=connection_class, **kwargs)
+
+
+def get_redis():
+    """
+    Вернуть общий для процесса клиент redis с настроенным пулом соединений.
+    При REDIS_BACKEND = 'memory' вместо сервера используется InMemoryRedis.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _create_client()
+    return _client
+
+
+def _create_client():
+    if settings.REDIS_BACKEND == 'memory':
+        return InMemoryRedis()
+    pool = CountingConnectionPool(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        db=settings.REDIS_DB,
+        max_connections=settings.REDIS_MAX_CONNECTIONS,
+        socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        socket_connect_timeout=settings.REDIS_CONNECT_TIMEOUT,
+        health_check_interval=settings.REDIS_HEALTH_CHECK_INTERVAL)
+    return redis.Redis(connection_pool=pool)
+
+
+def reset_redis():
+    """
+    Закрыть текущий клиент; следующий get_redis() создаст новый.
+    Используется в тестах и нагрузочных прогонах после смены настроек.
+    """
+    global _client
+    with _client_lock:
+        if isinstance(_client, redis.Redis):
+            _client.connection_pool.disconnect()
+        _client = None
+
+
+def pipeline():
+    """
+    Конвейер без транзакции MULTI/EXEC: все команды уходят
+    на сервер за один сетевой обмен.
+    """
+    return get_redis().pipeline(transaction=False)
+
+
+def _to_bytes(value):
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).encode()
+
+
+_local = threading.local()
+
+
+def _counted(method):
+    # учитывается только внешний вызов, но не вызовы одних
+    # команд из других и не команды внутри конвейера
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        depth = getattr(_local, 'depth', 0)
+        if depth:
+            return method(self, *args, **kwargs)
+        stats.record(1)
+        _local.depth = 1
+        start = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _local.depth = 0
+            stats.record_time(time.perf_counter() - start)
+    return wrapper
+
+
+class InMemoryRedis:
+    """
+    Хранилище в памяти процесса, реализующее используемые проектом
+    команды redis. Позволяет запускать тесты и нагрузочные прогоны
+    без сервера redis. Значения возвращаются в виде bytes, как в redis-py.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.data = {}
+        self.expires = {}
+
+    # служебные методы
+
+    def _alive(self, name):
+        expires = self.expires.get(name)
+        if expires is not None and expires <= time.monotonic():
+            self.data.pop(name, None)
+            self.expires.pop(name, None)
+        return name in self.data
+
+    def _get(self, name, kind, default=None):
+        name = _to_bytes(name)
+        if not self._alive(name):
+            if default is None:
+                return None
+            self.data[name] = default
+        value = self.data[name]
+        if not isinstance(value, kind):
+            raise redis.ResponseError('WRONGTYPE Operation against a key '
+                                      'holding the wrong kind of value')
+        return value
+
+    def _zset(self, name, create=False):
+        return self._get(name, dict, {} if create else None)
+
+    def _set_expiry(self, name, seconds):
+        self.expires[_to_bytes(name)] = time.monotonic() + seconds
+
+    def _drop_if_empty(self, name, value):
+        # redis удаляет ключ, когда множество становится пустым
+        if value is not None and not value:
+            name = _to_bytes(name)
+            self.data.pop(name, None)
+            self.expires.pop(name, None)
+
+    # ключи
+
+    def ping(self):
+        return True
+
+    def flushdb(self):
+        with self.lock:
+            self.data.clear()
+            self.expires.clear()
+        return True
+
+    def delete(self, *names):
+        with self.lock:
+            deleted = 0
+            for name in map(_to_bytes, names):
+                if self._alive(name):
+                    del self.data[name]
+                    self.expires.pop(name, None)
+                    deleted += 1
+            return deleted
+
+    def exists(self, *names):
+        with self.lock:
+            return sum(self._alive(_to_bytes(name)) for name in names)
+
+    def expire(self, name, time):
+        with self.lock:
+            if not self._alive(_to_bytes(name)):
+                return False
+            self._set_expiry(name, time)
+            return True
+
+    def ttl(self, name):
+        with self.lock:
+            name = _to_bytes(name)
+            if not self._alive(name):
+                return -2
+            if name not in self.expires:
+                return -1
+            return round(self.expires[name] - time.monotonic())
+
+    def keys(self, pattern='*'):
+        with self.lock:
+            pattern = _to_bytes(pattern).decode()
+            return [name for name in list(self.data)
+                    if self._alive(name)
+                    and fnmatch.fnmatchcase(name.decode(), pattern)]
+
+    # строки
+
+    def get(self, name):
+        with self.lock:
+            return self._get(name, bytes)
+
+    def set(self, name, value, ex=None, px=None, nx=False, xx=False):
+        with self.lock:
+            exists = self._alive(_to_bytes(name))
+            if (nx and exists) or (xx and not exists):
+                return None
+            self.data[_to_bytes(name)] = _to_bytes(value)
+            self.expires.pop(_to_bytes(name), None)
+            if ex is not None:
+                self._set_expiry(name, ex)
+            elif px is not None:
+                self._set_expiry(name, px / 1000)
+            return True
+
+    def incrby(self, name, amount=1):
+        with self.lock:
+            value = int(self._get(name, bytes) or 0) + amount
+            self.data[_to_bytes(name)] = _to_bytes(value)
+            return value
+
+    incr = incrby
+
+    def decr(self, name, amount=1):
+        return self.incrby(name, -amount)
+
+    # множества
+
+    def sadd(self, name, *values):
+        with self.lock:
+            members = self._get(name, set, set())
+            before = len(members)
+            members.update(map(_to_bytes, values))
+            return len(members) - before
+
+    def srem(self, name, *values):
+        with self.lock:
+            members = self._get(name, set) or set()
+            before = len(members)
+            members.difference_update(map(_to_bytes, values))
+            self._drop_if_empty(name, members)
+            return before - len(members)
+
+    def sismember(self, name, value):
+        with self.lock:
+            return _to_bytes(value) in (self._get(name, set) or ())
+
+    def smembers(self, name):
+        with self.lock:
+            return set(self._get(name, set) or ())
+
+    def scard(self, name):
+        with self.lock:
+            return len(self._get(name, set) or ())
+
+    # сортированные множества
+
+    def zadd(self, name, mapping, nx=False, xx=False):
+        with self.lock:
+            zset = self._zset(name, create=True)
+            added = 0
+            for member, score in mapping.items():
+                member = _to_bytes(member)
+                exists = member in zset
+                if (nx and exists) or (xx and not exists):
+                    continue
+                added += not exists
+                zset[member] = float(score)
+            return added
+
+    def zincrby(self, name, amount, value):
+        with self.lock:
+            zset = self._zset(name, create=True)
+            member = _to_bytes(value)
+            zset[member] = zset.get(member, 0.0) + float(amount)
+            return zset[member]
+
+    def zscore(self, name, value):
+        with self.lock:
+            return (self._zset(name) or {}).get(_to_bytes(value))
+
+    def zcard(self, name):
+        with self.lock:
+            return len(self._zset(name) or {})
+
+    def zrem(self, name, *values):
+        with self.lock:
+            zset = self._zset(name) or {}
+            removed = sum(zset.pop(_to_bytes(value), None) is not None
+                          for value in values)
+            self._drop_if_empty(name, zset)
+            return removed
+
+    def _sorted(self, name, desc):
+        items = sorted((self._zset(name) or {}).items(),
+                       key=lambda item: (item[1], item[0]),
+                       reverse=desc)
+        return items
+
+    @staticmethod
+    def _slice(items, start, end):
+        # индексы включительные, отрицательные отсчитываются с конца;
+        # диапазон за пределами списка пуст, а не оборачивается,
+        # как срез Python
+        length = len(items)
+        if start < 0:
+            start = max(length + start, 0)
+        if end < 0:
+            end = length + end
+        if end < 0 or start > end:
+            return []
+        return items[start:end + 1]
+
+    def zrange(self, name, start, end, desc=False, withscores=False,
+               score_cast_func=float):
+        with self.lock:
+            items = self._slice(self._sorted(name, desc), start, end)
+        if withscores:
+            return [(member, score_cast_func(score))
+                    for member, score in items]
+        return [member for member, _ in items]
+
+    def zrevrange(self, name, start, end, withscores=False,
+                  score_cast_func=float):
+        return self.zrange(name, start, end, desc=True,
+                           withscores=withscores,
+                           score_cast_func=score_cast_func)
+
+    def zremrangebyrank(self, name, min, max):
+        with self.lock:
+            zset = self._zset(name) or {}
+            items = self._slice(self._sorted(name, False), min, max)
+            for member, _ in items:
+                del zset[member]
+            self._drop_if_empty(name, zset)
+            return len(items)
+
+    def zunionstore(self, dest, keys, aggregate=None):
+        if not isinstance(keys, dict):
+            keys = {key: 1 for key in keys}
+        aggregate = (aggregate or 'SUM').upper()
+        with self.lock:
+            result = {}
+            for key, weight in keys.items():
+                for member, score in (self._zset(key) or {}).items():
+                    score *= weight
+                    if member not in result:
+                        result[member] = score
+                    elif aggregate == 'SUM':
+                        result[member] += score
+                    elif aggregate == 'MIN':
+                        result[member] = min(result[member], score)
+                    else:
+                        result[member] = max(result[member], score)
+            self.delete(dest)
+            if result:
+                self.data[_to_bytes(dest)] = result
+            return len(result)
+
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+
+
+class InMemoryPipeline:
+    """
+    Конвейер для InMemoryRedis: команды копятся и выполняются
+    под одной блокировкой при вызове execute().
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def execute(self, raise_on_error=True):
+        commands, self.commands = self.commands, []
+        stats.record(len(commands))
+        depth = getattr(_local, 'depth', 0)
+        _local.depth = depth + 1
+        start = time.perf_counter()
+        try:
+            with self.client.lock:
+                return [method(*args, **kwargs)
+                        for method, args, kwargs in commands]
+        finally:
+            _local.depth = depth
+            stats.record_time(time.perf_counter() - start)
+
+
+for _name in ['ping', 'flushdb', 'delete', 'exists', 'expire', 'ttl', 'keys',
+              'get', 'set', 'incrby', 'decr', 'sadd', 'srem', 'sismember',
+              'smembers', 'scard', 'zadd', 'zincrby', 'zscore', 'zcard',
+              'zrem', 'zrange', 'zrevrange', 'zremrangebyrank',
+              'zunionstore']:
+    setattr(InMemoryRedis, _name, _counted(getattr(InMemoryRedis, _name)))
+InMemoryRedis.incr = InMemoryRedis.incrby
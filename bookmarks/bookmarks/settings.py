@@ -52,25 +52,32 @@ INSTALLED_APPS = [
     'social_django',
     'django_extensions',
     'easy_thumbnails',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
+    # показатели запросов, первым, чтобы учитывать время всех остальных
+    'bookmarks.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'account.authentication.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# debug toolbar замедляет каждый запрос, поэтому подключается
+# только при разработке
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.insert(1, 'debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'bookmarks.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates, учитывающий время рендеринга
+        'BACKEND': 'bookmarks.metrics.InstrumentedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -99,6 +106,107 @@ DATABASES = {
 REDIS_HOST = 'localhost'
 REDIS_PORT = 6379
 REDIS_DB = 0
+# 'redis' - сервер redis, 'memory' - хранилище в памяти процесса
+# (для тестов и нагрузочных прогонов без сервера)
+REDIS_BACKEND = 'redis'
+REDIS_MAX_CONNECTIONS = 50
+REDIS_SOCKET_TIMEOUT = 0.5  # с
+REDIS_CONNECT_TIMEOUT = 0.5  # с
+REDIS_HEALTH_CHECK_INTERVAL = 30  # с
+
+# Кеш Django хранится в том же сервере redis
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}/{REDIS_DB}',
+        'KEY_PREFIX': 'cache',
+        'OPTIONS': {
+            # команды кеша учитываются вместе с командами проекта
+            'pool_class': 'bookmarks.redis_client.CountingConnectionPool',
+            'socket_timeout': REDIS_SOCKET_TIMEOUT,
+            'socket_connect_timeout': REDIS_CONNECT_TIMEOUT,
+        },
+    }
+}
+if REDIS_BACKEND == 'memory':
+    # без сервера redis кеш тоже хранится в памяти процесса
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'KEY_PREFIX': 'cache',
+        }
+    }
+# Как долго хранить в кеше пользователя вместе с профилем, с
+AUTH_USER_CACHE_TTL = 300
+# Как долго хранить в кеше страницы списка изображений, с
+IMAGE_LIST_CACHE_TTL = 600
+
+# Отложенная запись счетчиков просмотров в redis
+VIEW_COUNTER_FLUSH_INTERVAL = 1.0  # с
+VIEW_COUNTER_FLUSH_SIZE = 1000  # просмотров
+VIEW_COUNTER_TOTALS_TTL = 30.0  # с, как долго доверять известному значению
+
+# Рейтинги изображений по времени
+RANKING_HOURLY_TTL = 48 * 60 * 60  # с
+
+RANKING_DAILY_TTL = 8 * 24 * 60 * 60  # с
+RANKING_TRENDING_HOURS = 24
+RANKING_DECAY = 0.8  # вес просмотров, сделанных час назад
+RANKING_CACHE_TTL = 60  # с
+
+# Показатели запросов (bookmarks.metrics)
+METRICS_ALLOWED_IPS = ['127.0.0.1']  # адреса, с которых доступен /metrics/
+# За обратным прокси на той же машине REMOTE_ADDR всегда равен
+# 127.0.0.1, поэтому в таком развертывании нужно задать токен:
+# Prometheus передает его в заголовке Authorization: Bearer <токен>
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_SLOW_REQUEST = 0.5  # с, более долгие запросы записываются в журнал
+
+# Максимальная длина ленты действий одного пользователя
+ACTIONS_FEED_LENGTH = 200
+# Окно устранения повторяющихся действий, с
+ACTIONS_DEDUP_WINDOW = 60
+# Новые действия записываются пачками раз в интервал, с
+# (0 - записывать сразу)
+ACTIONS_FLUSH_INTERVAL = 1.0
+ACTIONS_FLUSH_SIZE = 100
+# Как долго хранить в кеше отрендеренные карточки действий, с
+ACTIONS_CARD_CACHE_TTL = 24 * 60 * 60
+# Действия старше этого числа дней переносятся в архив командой
+# archive_actions, пачками по ACTIONS_ARCHIVE_CHUNK_SIZE
+ACTIONS_RETENTION_DAYS = 90
+ACTIONS_ARCHIVE_DIR = BASE_DIR / 'archive' / 'actions'
+ACTIONS_ARCHIVE_CHUNK_SIZE = 1000
+
+# Фоновая загрузка изображений по URL-адресу
+IMAGE_INGEST_WORKERS = 4  # число рабочих потоков
+IMAGE_INGEST_PER_HOST = 2  # одновременных загрузок с одного хоста
+IMAGE_INGEST_TIMEOUT = (3.05, 10)  # тайм-ауты соединения и чтения, с
+IMAGE_INGEST_RETRIES = 2
+IMAGE_INGEST_BACKOFF = 0.5  # начальная задержка между попытками, с
+IMAGE_INGEST_MAX_SIZE = 10 * 1024 * 1024
+
+# Миниатюры генерируются заранее для каждого из этих псевдонимов
+THUMBNAIL_ALIASES = {
+    'images.Image.image': {
+        'list': {'size': (300, 300), 'crop': 'smart'},
+        'detail': {'size': (300, 0)},
+        'action': {'size': (80, 80), 'crop': '100%'},
+    },
+    'account.Profile.photo': {
+        'avatar': {'size': (180, 180)},
+        'action': {'size': (80, 80), 'crop': '100%'},
+    },
+}
+THUMBNAIL_WORKERS = 2
+
+# Рекомендации «этим пользователям также понравилось»
+IMAGE_RELATED_COUNT = 10  # сколько похожих изображений хранить и выводить
+IMAGE_COLIKES_USER_LIMIT = 100  # сколько последних лайков учитывать сразу
+# Общие лайки обновляются в фоне пачками раз в интервал, с
+# (0 - обновлять сразу)
+IMAGE_COLIKES_FLUSH_INTERVAL = 5.0
+IMAGE_COLIKES_FLUSH_SIZE = 100
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -119,7 +227,6 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 AUTHENTICATION_BACKENDS = [
-    'django.contrib.auth.backends.ModelBackend',
     'account.authentication.EmailAuthBackend',
     'social_core.backends.facebook.FacebookOAuth2',
     'social_core.backends.twitter.TwitterOAuth',
@@ -0,0 +1,22 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from .redis_client import reset_redis
+
+
+@override_settings(
+    REDIS_BACKEND='memory',
+    # действия и общие лайки записываются сразу, без фонового потока
+    ACTIONS_FLUSH_INTERVAL=0,
+    IMAGE_COLIKES_FLUSH_INTERVAL=0,
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class MemoryRedisTestCase(TestCase):
+    """
+    Тест с хранилищем InMemoryRedis и кешем в памяти процесса вместо
+    сервера redis. Каждый тест начинается с пустого хранилища и кеша.
+    """
+
+    def setUp(self):
+        super().setUp()
+        reset_redis()
+        cache.clear()
@@ -0,0 +1,55 @@
+from django.test import SimpleTestCase
+from .redis_client import InMemoryRedis
+
+
+class InMemoryRedisTests(SimpleTestCase):
+    def setUp(self):
+        self.r = InMemoryRedis()
+        self.r.zadd('z', {'a': 1, 'b': 2, 'c': 3})
+
+    def test_zrange_indexes(self):
+        self.assertEqual(self.r.zrange('z', 0, -1), [b'a', b'b', b'c'])
+        self.assertEqual(self.r.zrange('z', -2, -1), [b'b', b'c'])
+        self.assertEqual(self.r.zrange('z', 1, 10), [b'b', b'c'])
+        self.assertEqual(self.r.zrange('z', -10, 0), [b'a'])
+        self.assertEqual(self.r.zrevrange('z', 0, 1), [b'c', b'b'])
+
+    def test_empty_ranges(self):
+        # в redis такие диапазоны пусты, а не оборачиваются с конца
+        self.assertEqual(self.r.zrange('z', 0, -5), [])
+        self.assertEqual(self.r.zrevrange('z', 0, -4), [])
+        self.assertEqual(self.r.zrange('z', 2, 1), [])
+        self.assertEqual(self.r.zrange('z', 3, 5), [])
+        self.assertEqual(self.r.zrange('missing', 0, -1), [])
+
+    def test_zremrangebyrank(self):
+        self.assertEqual(self.r.zremrangebyrank('z', 1, -5), 0)
+        self.assertEqual(self.r.zremrangebyrank('z', 0, -3), 1)
+        self.assertEqual(self.r.zrange('z', 0, -1), [b'b', b'c'])
+
+    def test_trim_to_length(self):
+        # обрезка ленты до N последних элементов, как в push_actions()
+        for i in range(150):
+            self.r.zadd('feed', {i: i})
+        self.r.zremrangebyrank('feed', 0, -201)
+        self.assertEqual(self.r.zcard('feed'), 150)
+        self.r.zremrangebyrank('feed', 0, -101)
+        self.assertEqual(self.r.zrange('feed', 0, 0), [b'50'])
+
+    def test_empty_keys_are_deleted(self):
+        self.r.zrem('z', 'a', 'b')
+        self.assertEqual(self.r.exists('z'), 1)
+        self.r.zrem('z', 'c')
+        self.assertEqual(self.r.exists('z'), 0)
+        self.r.zadd('z', {'a': 1})
+        self.r.zremrangebyrank('z', 0, -1)
+        self.r.sadd('s', 'x')
+        self.r.srem('s', 'x')
+        self.assertEqual(self.r.keys(), [])
+        self.assertEqual(self.r.delete('z', 's'), 0)
+
+    def test_pipeline(self):
+        pipe = self.r.pipeline(transaction=False)
+        pipe.zincrby('z', 5, 'a')
+        pipe.zrevrange('z', 0, 0, withscores=True)
+        self.assertEqual(pipe.execute(), [6.0, [(b'a', 6.0)]])
@@ -0,0 +1,36 @@
+import logging
+import redis
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+def get_versions(*keys):
+    """
+    Вернуть текущие номера версий для ключей одним обращением к кешу.
+    """
+    values = cache.get_many(keys)
+    return [values.get(key, 0) for key in keys]
+
+
+def bump_version(*keys):
+    """
+    Увеличить номера версий; записи кеша, построенные
+    со старыми номерами, больше не будут прочитаны.
+    """
+    for key in keys:
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                # ключа еще нет либо он был вытеснен из кеша
+                cache.set(key, 1, None)
+        except redis.RedisError:
+            logger.warning('Could not bump cache version %s', key)
+
+
+"""
+Версионная инвалидация кеша: ключ записи включает номер версии, который
+хранится отдельно и увеличивается при изменении исходных данных.
+Вместо поиска и удаления всех зависимых записей достаточно одной
+команды INCR, а устаревшие записи удаляются по истечении срока жизни."""
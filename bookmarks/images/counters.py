@@ -0,0 +1,118 @@
+import logging
+import time
+from collections import Counter, OrderedDict
+import redis
+from django.conf import settings
+from bookmarks.buffers import PeriodicBuffer
+from bookmarks.redis_client import get_redis, pipeline
+from .ranking import record_views
+
+logger = logging.getLogger(__name__)
+
+
+def views_key(image_id):
+    return f'image:{image_id}:views'
+
+
+class ViewCounterBuffer(PeriodicBuffer):
+    """
+    Отложенная запись счетчиков просмотров изображений в redis.
+    """
+
+    # сколько известных итоговых значений хранить в памяти
+    max_totals = 10000
+
+    interval_setting = 'VIEW_COUNTER_FLUSH_INTERVAL'
+    size_setting = 'VIEW_COUNTER_FLUSH_SIZE'
+
+    def __init__(self):
+        super().__init__()
+        self.pending = Counter()
+        self.inflight = Counter()
+        self.size = 0
+        # последние известные значения счетчиков: id -> (значение, время)
+        self.totals = OrderedDict()
+
+    @property
+    def totals_ttl(self):
+        return settings.VIEW_COUNTER_TOTALS_TTL
+
+    def incr(self, image_id):
+        with self.lock:
+            self.pending[image_id] += 1
+            self.size += 1
+            size = self.size
+        self.added(size)
+
+    def get(self, image_id):
+        """
+        Вернуть число просмотров с учетом еще не записанных приращений.
+        """
+        with self.lock:
+            delta = self.pending[image_id] + self.inflight[image_id]
+            known = self.totals.get(image_id)
+        if known is None or time.monotonic() - known[1] > self.totals_ttl:
+            try:
+                total = int(get_redis().get(views_key(image_id)) or 0)
+            except redis.RedisError:
+                # показать последнее известное значение, даже устаревшее
+                logger.warning('Could not read view counter of image %s',
+                               image_id)
+                return (known[0] if known else 0) + delta
+            with self.lock:
+                # значение могло обновиться, пока выполнялся запрос
+                known = self.totals.get(image_id)
+                if known is not None:
+                    total = max(total, known[0])
+                self._remember(image_id, total)
+                delta = self.pending[image_id] + self.inflight[image_id]
+                total = self.totals[image_id][0]
+        else:
+            total = known[0]
+        return total + delta
+
+    def _remember(self, image_id, total):
+        self.totals[image_id] = (total, time.monotonic())
+        self.totals.move_to_end(image_id)
+        if len(self.totals) > self.max_totals:
+            self.totals.popitem(last=False)
+
+    def drain(self):
+        batch = self.pending
+        self.inflight = batch
+        self.pending = Counter()
+        self.size = 0
+        return batch
+
+    def write(self, batch):
+        pipe = pipeline()
+        for image_id, count in batch.items():
+            pipe.incrby(views_key(image_id), count)
+        record_views(pipe, batch)
+        try:
+            results = pipe.execute()
+        except redis.RedisError:
+            logger.exception('Could not flush %s view counter(s)',
+                             len(batch))
+            with self.lock:
+                # вернуть приращения в буфер до следующей попытки
+                self.pending.update(batch)
+                self.size += sum(batch.values())
+                self.inflight = Counter()
+            return
+        with self.lock:
+            for image_id, total in zip(batch, results):
+                self._remember(image_id, total)
+            self.inflight = Counter()
+
+
+view_counter = ViewCounterBuffer()
+
+
+"""
+Каждый просмотр изображения лишь увеличивает счетчик в памяти процесса.
+Фоновый поток раз в VIEW_COUNTER_FLUSH_INTERVAL секунд (или как только
+накопится VIEW_COUNTER_FLUSH_SIZE просмотров) отправляет все приращения
+одним конвейером redis: INCRBY для счетчика просмотров и ZINCRBY для
+рейтингов (см. images.ranking). Чтение суммирует последнее известное значение из redis
+и еще не записанные приращения, поэтому показываемое число остается точным."""
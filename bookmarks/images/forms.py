@@ -1,8 +1,6 @@
 from django import forms
 from .models import Image
-from django.core.files.base import ContentFile
-from django.utils.text import slugify
-import requests
+from .ingest import has_valid_extension
 
 
 class ImageCreateForm(forms.ModelForm):
@@ -13,22 +11,22 @@ class ImageCreateForm(forms.ModelForm):
             'url': forms.HiddenInput,
         }
 
-        def save(self, force_insert=False,
-                 force_update=False,
-                 commit=True):
-            image = super().save(commit=False)
-            image_url = self.cleaned_data['url']
-            name = slugify(image.title)
-            extension = image_url.rsplit('.', 1)[1].lower()
-            image_name = f'{name}.{extension}'
-            # скачать изображение с данного URL-адреса
-            response = requests.get(image_url)
-            image.image.save(image_name,
-                             ContentFile(response.content),
-                             save=False)
-            if commit:
-                image.save()
-            return image
+    def clean_url(self):
+        url = self.cleaned_data['url']
+        if not has_valid_extension(url):
+            raise forms.ValidationError('The given URL does not ' \
+                                        'match valid image extensions.')
+        return url
+
+    def save(self, force_insert=False,
+             force_update=False,
+             commit=True):
+        image = super().save(commit=False)
+        # файл будет скачан в фоне, см. images.ingest
+        image.status = Image.Status.PENDING
+        if commit:
+            image.save()
+        return image
 
 
 """
@@ -53,16 +51,6 @@ url и description. Пользователи не будут вводить URL-
 в том случае, если параметр commit равен True."""
 
 
-def clean_url(self):
-    url = self.cleaned_data['url']
-    valid_extensions = ['jpg', 'jpeg', 'png']
-    extension = url.rsplit('.', 1)[1].lower()
-    if extension not in valid_extensions:
-        raise forms.ValidationError('The given URL does not ' \
-                                    'match valid image extensions.')
-    return url
-
-
 """
 Здесь мы определили метод clean_url(), чтобы очищать поле url. Исходный
 код работает следующим образом:
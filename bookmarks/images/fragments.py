@@ -0,0 +1,71 @@
+import redis
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from bookmarks.pagination import KeysetPaginator
+from bookmarks.versions import get_versions, bump_version
+from .models import Image
+
+LIST_VERSION_KEY = 'images:list:version'
+
+
+def user_list_version_key(user_id):
+    return f'images:list:user:{user_id}:version'
+
+
+def image_paginator(user_id=None):
+    """
+    Постраничная разбивка готовых изображений, при необходимости
+    только изображений одного пользователя.
+    """
+    images = Image.objects.filter(status=Image.Status.READY)
+    if user_id is not None:
+        images = images.filter(user_id=user_id)
+    return KeysetPaginator(images, 8)
+
+
+def invalidate_lists(image):
+    """
+    Сделать устаревшими закешированные страницы общего списка
+    и списка изображений автора.
+    """
+    bump_version(LIST_VERSION_KEY, user_list_version_key(image.user_id))
+
+
+def render_images_page(user_id=None, cursor=None):
+    """
+    Вернуть HTML страницы изображений и курсор следующей страницы.
+    Для испорченного курсора возбуждается InvalidCursor.
+    """
+    if user_id is None:
+        version_key = LIST_VERSION_KEY
+    else:
+        version_key = user_list_version_key(user_id)
+    try:
+        version, = get_versions(version_key)
+        key = f'images:list:{user_id or "all"}:v{version}:{cursor or ""}'
+        page = cache.get(key)
+    except redis.RedisError:
+        key = page = None
+    if page is None:
+        images = image_paginator(user_id).page(cursor)
+        html = ''
+        if images:
+            html = render_to_string('images/image/list_images.html',
+                                    {'images': images})
+        page = (html, images.next_cursor)
+        if key is not None:
+            try:
+                cache.set(key, page, settings.IMAGE_LIST_CACHE_TTL)
+            except redis.RedisError:
+                pass
+    return page
+
+
+"""
+Страницы списка изображений одинаковы для всех пользователей, поэтому
+в кеше хранится готовый HTML фрагмента list_images.html вместе с курсором
+следующей страницы. Ключ включает курсор и номер версии списка: общий
+список и список каждого автора имеют свои версии, которые увеличиваются
+при сохранении, удалении изображения и генерации его миниатюр. Части
+страницы, зависящие от пользователя (меню, имя), в кеш не попадают."""
@@ -0,0 +1,44 @@
+import hashlib
+import io
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from PIL import Image as PILImage
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+def normalize_url(url):
+    """
+    Привести URL к каноническому виду: схема и хост в нижнем регистре,
+    без порта по умолчанию и фрагмента, параметры запроса отсортированы.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+def url_hash(url):
+    return hashlib.sha256(normalize_url(url).encode()).hexdigest()
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+def perceptual_hash(content):
+    """
+    Разностный хеш (dHash) изображения: 64 бита в виде 16 шестнадцатеричных
+    цифр. У визуально похожих изображений хеши отличаются в немногих битах.
+    """
+    image = PILImage.open(io.BytesIO(content)).convert('L').resize((9, 8))
+    pixels = list(image.getdata())
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            bits = bits << 1 | (left > right)
+    return f'{bits:016x}'
@@ -0,0 +1,276 @@
+import io
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+import requests
+from PIL import Image as PILImage
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils.text import slugify
+from .hashing import content_hash, perceptual_hash
+from .models import Image
+from .thumbnails import schedule as schedule_thumbnails
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPES = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+}
+# расширения URL, которые принимает форма и импорт закладок
+VALID_EXTENSIONS = ['jpg', 'jpeg', 'png']
+
+
+def has_valid_extension(url):
+    return url.rsplit('.', 1)[-1].lower() in VALID_EXTENSIONS
+
+
+class IngestError(Exception):
+    """
+    Изображение не может быть загружено, повторять попытку нет смысла.
+    """
+
+
+class HostLimiter:
+    """
+    Ограничивает число одновременных загрузок с одного хоста.
+    Задачи, которым не хватило места, ждут в очереди своего хоста
+    и запускаются при освобождении места. Хост без загрузок
+    и очереди удаляется из словарей.
+    """
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.condition = threading.Condition()
+        # число занятых мест и очередь отложенных задач каждого хоста
+        self.active = {}
+        self.waiting = {}
+
+    def _take(self, host):
+        if self.active.get(host, 0) >= self.limit:
+            return False
+        self.active[host] = self.active.get(host, 0) + 1
+        return True
+
+    def acquire(self, host, blocking=False):
+        with self.condition:
+            while not self._take(host):
+                if not blocking:
+                    return False
+                self.condition.wait()
+            return True
+
+    def acquire_or_defer(self, host, task):
+        """
+        Занять место и вернуть True либо поставить task в очередь
+        хоста: ее вызовет release(), передав ей освободившееся место.
+        """
+        with self.condition:
+            if self._take(host):
+                return True
+            self.waiting.setdefault(host, deque()).append(task)
+            return False
+
+    def release(self, host):
+        with self.condition:
+            queue = self.waiting.get(host)
+            if queue:
+                # место не освобождается, а переходит следующей задаче
+                task = queue.popleft()
+                if not queue:
+                    del self.waiting[host]
+            else:
+                task = None
+                self.active[host] -= 1
+                if not self.active[host]:
+                    del self.active[host]
+                self.condition.notify_all()
+        if task is not None:
+            task()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+host_limiter = HostLimiter(settings.IMAGE_INGEST_PER_HOST)
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_INGEST_WORKERS,
+                thread_name_prefix='image-ingest')
+    return _executor
+
+
+def download(url):
+    """
+    Скачать изображение и вернуть пару (содержимое, расширение).
+    """
+    response = requests.get(url,
+                            timeout=settings.IMAGE_INGEST_TIMEOUT,
+                            stream=True)
+    with response:
+        if 400 <= response.status_code < 500:
+            raise IngestError(f'HTTP {response.status_code}')
+        response.raise_for_status()
+        content_type = response.headers.get('Content-Type', '')
+        content_type = content_type.split(';')[0].strip().lower()
+        if content_type not in CONTENT_TYPES:
+            raise IngestError(f'Unsupported content type {content_type!r}')
+        content = io.BytesIO()
+        for chunk in response.iter_content(chunk_size=64 * 1024):
+            content.write(chunk)
+            if content.tell() > settings.IMAGE_INGEST_MAX_SIZE:
+                raise IngestError('Image is too large')
+    content = content.getvalue()
+    try:
+        PILImage.open(io.BytesIO(content)).verify()
+    except Exception:
+        raise IngestError('Invalid image data')
+    return content, CONTENT_TYPES[content_type]
+
+
+def fetch(url):
+    """
+    Скачать изображение, повторяя попытку при сетевых ошибках
+    с экспоненциально растущей задержкой.
+    """
+    retries = settings.IMAGE_INGEST_RETRIES
+    for attempt in range(retries + 1):
+        try:
+            return download(url)
+        except requests.RequestException as e:
+            if attempt == retries:
+                raise IngestError(str(e))
+            time.sleep(settings.IMAGE_INGEST_BACKOFF * 2 ** attempt)
+
+
+def find_stored(**lookup):
+    """
+    Вернуть готовое изображение с файлом, найденное по url_hash
+    либо content_hash, чтобы использовать его файл повторно.
+    """
+    return Image.objects.filter(status=Image.Status.READY, **lookup) \
+        .exclude(image='') \
+        .only('id', 'image', 'content_hash', 'phash') \
+        .first()
+
+
+def store(content, extension, name):
+    """
+    Сохранить файл, если файла с таким же содержимым еще нет.
+    Вернуть (имя файла, хеш содержимого, перцептивный хеш, новый ли файл).
+    """
+    digest = content_hash(content)
+    existing = find_stored(content_hash=digest)
+    if existing is not None:
+        return existing.image.name, digest, existing.phash, False
+    try:
+        phash = perceptual_hash(content)
+    except Exception:
+        phash = ''
+    field = Image._meta.get_field('image')
+    file_name = field.generate_filename(None, f'{name}.{extension}')
+    file_name = field.storage.save(file_name, ContentFile(content))
+    return file_name, digest, phash, True
+
+
+def ingest(image_id):
+    """
+    Загрузить файл ожидающего изображения и пометить его готовым.
+    """
+    close_old_connections()
+    try:
+        image = Image.objects.get(id=image_id,
+                                  status=Image.Status.PENDING)
+    except Image.DoesNotExist:
+        return
+    existing = None
+    if image.url_hash:
+        existing = find_stored(url_hash=image.url_hash)
+    if existing is not None:
+        # этот URL уже скачивался: взять готовый файл и миниатюры
+        name, digest, phash = existing.image.name, \
+            existing.content_hash, existing.phash
+        new_file = False
+    else:
+        try:
+            content, extension = fetch(image.url)
+        except IngestError as e:
+            logger.warning('Image %s ingestion failed: %s', image.id, e)
+            image.status = Image.Status.FAILED
+            image.save(update_fields=['status'])
+            return
+        name, digest, phash, new_file = store(
+            content, extension, slugify(image.title) or image.id)
+    image.image = name
+    image.content_hash = digest
+    image.phash = phash
+    image.status = Image.Status.READY
+    image.save(update_fields=['image', 'content_hash', 'phash', 'status'])
+    if new_file:
+        schedule_thumbnails(image.image)
+
+
+def _run(image_id, host):
+    try:
+        ingest(image_id)
+    except Exception:
+        logger.exception('Image %s ingestion crashed', image_id)
+    finally:
+        close_old_connections()
+        host_limiter.release(host)
+
+
+def process(image_id, url):
+    """
+    Загрузить изображение в текущем потоке, дождавшись
+    освобождения лимита на хост.
+    """
+    host = urlsplit(url).hostname or ''
+    host_limiter.acquire(host, blocking=True)
+    _run(image_id, host)
+
+
+def submit(image_id, url):
+    """
+    Поставить загрузку в пул. Если лимит на хост исчерпан,
+    задача ждет в очереди хоста, не занимая рабочий поток.
+    """
+    host = urlsplit(url).hostname or ''
+
+    def start():
+        return get_executor().submit(_run, image_id, host)
+
+    if not host_limiter.acquire_or_defer(host, start):
+        return None
+    return start()
+
+
+def enqueue(image):
+    """
+    Поставить изображение в очередь после фиксации транзакции.
+    """
+    transaction.on_commit(lambda: submit(image.id, image.url))
+
+
+"""
+Изображение сохраняется в базе данных со статусом pending, и представление
+сразу возвращает ответ. Пул потоков с ограниченным числом рабочих
+(IMAGE_INGEST_WORKERS) скачивает файл с тайм-аутами, повторными попытками
+и ограничением одновременных запросов к одному хосту (IMAGE_INGEST_PER_HOST):
+загрузки сверх лимита ждут в очереди хоста и передаются в пул, когда
+завершается одна из текущих загрузок с этого хоста. Рабочий поток
+проверяет тип и содержимое файла и помечает изображение как ready либо
+failed. Строки со статусом pending служат долговременной очередью:
+после перезапуска их дочитывает команда ingest_images.
+
+Если изображение с тем же нормализованным URL или тем же содержимым
+уже загружено, новая закладка ссылается на его файл, поэтому файл
+не скачивается и не хранится повторно, а миниатюры не генерируются заново."""
@@ -0,0 +1,47 @@
+from django.db import transaction
+from django.db.models import F
+from .models import Image
+from .related import record_like, record_unlike
+
+ImageLike = Image.users_like.through
+
+
+def like_image(image, user):
+    """
+    Поставить лайк и увеличить счетчик в одной транзакции.
+    Вернуть True, если лайк был добавлен.
+    """
+    with transaction.atomic():
+        _, created = ImageLike.objects.get_or_create(image_id=image.id,
+                                                     user_id=user.id)
+        if created:
+            Image.objects.filter(id=image.id) \
+                .update(total_likes=F('total_likes') + 1)
+    if created:
+        record_like(image.id, user.id)
+    return created
+
+
+def unlike_image(image, user):
+    """
+    Снять лайк и уменьшить счетчик в одной транзакции.
+    Вернуть True, если лайк был снят.
+    """
+    with transaction.atomic():
+        deleted, _ = ImageLike.objects.filter(image_id=image.id,
+                                              user_id=user.id).delete()
+        if deleted:
+            Image.objects.filter(id=image.id, total_likes__gt=0) \
+                .update(total_likes=F('total_likes') - 1)
+    if deleted:
+        record_unlike(image.id, user.id)
+    return bool(deleted)
+
+
+"""
+Строка связи многие-ко-многим и счетчик total_likes изменяются в одной
+транзакции, а сам счетчик обновляется выражением F() прямо в базе данных
+(UPDATE ... SET total_likes = total_likes + 1). Так одновременные лайки
+не теряют обновления, не выполняется COUNT и не перезаписывается вся
+строка изображения. Возможное расхождение исправляет команда
+reconcile_likes."""
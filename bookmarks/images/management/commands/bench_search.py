@@ -0,0 +1,134 @@
+import random
+import statistics
+import time
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from account.management.commands.benchmark import percentile
+from account.management.commands.generate_data import zipf_weights
+from account.models import Profile
+from bookmarks.versions import bump_version
+from images.fragments import LIST_VERSION_KEY
+from images.hashing import url_hash
+from images.models import Image
+from images.search import PER_PAGE, _fts_page, _icontains_page, \
+    fts_available, index_images
+
+SYLLABLES = ['ka', 'lo', 'mi', 'ne', 'ru', 'ta', 'vo', 'zi', 'sha', 'pe',
+             'do', 'gu', 'bri', 'sto', 'fen', 'mar', 'qui', 'lan']
+BENCH_USERNAME = 'search_bench'
+
+
+class Command(BaseCommand):
+    help = 'Сравнить полнотекстовый поиск FTS5 с фильтром icontains'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--images', type=int, default=100000,
+                            help='Сколько изображений должно быть в базе; '
+                                 'недостающие создаются (например, '
+                                 '1000000 для замера на миллионе)')
+        parser.add_argument('--words', type=int, default=20000,
+                            help='Размер словаря создаваемых изображений')
+        parser.add_argument('--queries', type=int, default=20,
+                            help='Число запросов каждого вида')
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true',
+                            help='Не удалять созданные изображения')
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError('The full-text index is only available '
+                               'on SQLite')
+        # все созданное замером отменяется откатом транзакции,
+        # чтобы изображения не попали в общий список и ленты
+        with transaction.atomic():
+            try:
+                self.run(options)
+            finally:
+                if not options['keep']:
+                    transaction.set_rollback(True)
+
+    def run(self, options):
+        self.keep = options['keep']
+        self.rng = random.Random(options['seed'])
+        self.vocabulary = self.make_vocabulary(options['words'])
+        self.populate(options['images'], options['batch_size'])
+        # частые, средние и редкие слова по рангу в законе Ципфа
+        words = self.vocabulary
+        kinds = {
+            'common': words[:10],
+            'medium': words[100:1000],
+            'rare': words[-1000:],
+        }
+        for kind, candidates in kinds.items():
+            queries = [self.rng.choice(candidates)
+                       for _ in range(options['queries'])]
+            self.compare(kind, queries)
+        queries = [f'{self.rng.choice(words[:100])} '
+                   f'{self.rng.choice(words[100:1000])}'
+                   for _ in range(options['queries'])]
+        self.compare('two words', queries)
+
+    def make_vocabulary(self, size):
+        words = set()
+        while len(words) < size:
+            words.add(''.join(self.rng.choice(SYLLABLES)
+                              for _ in range(self.rng.randint(2, 4))))
+        words = sorted(words)
+        self.rng.shuffle(words)
+        return words
+
+    def text(self, weights, count):
+        return ' '.join(self.rng.choices(self.vocabulary,
+                                         cum_weights=weights, k=count))
+
+    def populate(self, target, batch_size):
+        missing = target - Image.objects.count()
+        if missing <= 0:
+            return
+        user, _ = User.objects.get_or_create(username=BENCH_USERNAME)
+        weights = zipf_weights(len(self.vocabulary), 1.0)
+        start = Image.objects.filter(user=user).count()
+        self.stdout.write(f'Creating {missing} image(s)...')
+        for offset in range(0, missing, batch_size):
+            images = []
+            for number in range(start + offset,
+                                start + min(offset + batch_size, missing)):
+                url = f'https://example.com/search/{number}.png'
+                title = self.text(weights, self.rng.randint(2, 6))
+                images.append(Image(
+                    user=user, title=title, slug=f'search-{number}',
+                    url=url, url_hash=url_hash(url),
+                    description=self.text(weights,
+                                          self.rng.randint(10, 40)),
+                    status=Image.Status.READY))
+            images = Image.objects.bulk_create(images)
+            index_images(images)
+            self.stdout.write(f'Created {offset + len(images)} image(s)')
+        Profile.objects.update_or_create(
+            user=user,
+            defaults={'images_count': Image.objects.filter(user=user)
+                      .count()})
+        if self.keep:
+            bump_version(LIST_VERSION_KEY)
+
+    def measure(self, search, queries):
+        times = []
+        found = 0
+        for query in queries:
+            start = time.perf_counter()
+            page = search(query, None, PER_PAGE)
+            times.append((time.perf_counter() - start) * 1000)
+            found += len(page)
+        return times, found
+
+    def compare(self, kind, queries):
+        for name, search in [('fts5', _fts_page),
+                             ('icontains', _icontains_page)]:
+            times, found = self.measure(search, queries)
+            self.stdout.write(
+                f'{kind:<10} {name:<10} p50 {percentile(times, 50):9.2f} ms  '
+                f'p99 {percentile(times, 99):9.2f} ms  '
+                f'mean {statistics.mean(times):9.2f} ms  '
+                f'{found / len(queries):.1f} results/page')
@@ -0,0 +1,30 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from account.models import Profile
+from images.models import Image
+from images.thumbnails import generate
+
+
+class Command(BaseCommand):
+    help = 'Сгенерировать миниатюры из THUMBNAIL_ALIASES для существующих файлов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=settings.THUMBNAIL_WORKERS)
+
+    def handle(self, *args, **options):
+        sources = [
+            (Image, 'image', Image.objects.filter(
+                status=Image.Status.READY).exclude(image='')),
+            (Profile, 'photo', Profile.objects.exclude(photo='')),
+        ]
+        total = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for model, field_name, queryset in sources:
+                pks = queryset.values_list('pk', flat=True)
+                for pk in pks.iterator(chunk_size=500):
+                    executor.submit(generate, model._meta.label,
+                                    pk, field_name)
+                    total += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} file(s)'))
@@ -0,0 +1,228 @@
+import csv
+import json
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils.text import slugify
+from account.models import Profile
+from actions.feed import fan_out
+from actions.models import Action
+from images.fragments import invalidate_lists
+from images.hashing import url_hash
+from images.ingest import IngestError, fetch, has_valid_extension, \
+    host_limiter, store
+from images.models import Image
+from images.search import index_images
+from images.thumbnails import schedule as schedule_thumbnails
+
+FIELDS = ['user', 'title', 'url', 'description']
+
+
+def read_rows(path, file_format):
+    """
+    Построчно читать закладки из CSV (с заголовком) или JSONL.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            yield from csv.DictReader(f)
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def download(url, title):
+    """
+    Скачать файл закладки и сохранить его, если такого содержимого
+    еще нет. Вернуть результат store() либо исключение IngestError.
+    """
+    host = urlsplit(url).hostname or ''
+    host_limiter.acquire(host, blocking=True)
+    try:
+        content, extension = fetch(url)
+    except IngestError as e:
+        return e
+    finally:
+        host_limiter.release(host)
+    try:
+        return store(content, extension, slugify(title) or 'image')
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Импортировать закладки изображений из CSV или JSONL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='По умолчанию определяется по расширению')
+        parser.add_argument('--workers', type=int,
+                            default=settings.IMAGE_INGEST_WORKERS * 4)
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--checkpoint',
+                            help='Файл с числом уже импортированных строк '
+                                 '(по умолчанию <path>.checkpoint)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'File {path} does not exist')
+        if not connection.features.can_return_rows_from_bulk_insert:
+            # без ИД новых строк нельзя создать действия
+            raise CommandError('The database backend cannot return ids '
+                               'from bulk inserts')
+        file_format = options['format'] or \
+            ('jsonl' if path.endswith(('.jsonl', '.json')) else 'csv')
+        self.checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        self.chunk_size = options['chunk_size']
+        self.usernames = {}
+        self.image_ct = ContentType.objects.get_for_model(Image)
+        self.stats = Counter()
+        self.started = time.monotonic()
+
+        done = self.read_checkpoint()
+        if done:
+            self.stdout.write(f'Resuming after row {done}')
+        position = 0
+        chunk = []
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for row in read_rows(path, file_format):
+                position += 1
+                if position <= done:
+                    continue
+                chunk.append(row)
+                if len(chunk) >= self.chunk_size:
+                    self.import_chunk(executor, chunk)
+                    self.write_checkpoint(position)
+                    chunk = []
+            if chunk:
+                self.import_chunk(executor, chunk)
+                self.write_checkpoint(position)
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.stats["ready"]} image(s), '
+            f'{self.stats["failed"]} failed, '
+            f'{self.stats["skipped"]} skipped'))
+
+    def read_checkpoint(self):
+        try:
+            with open(self.checkpoint) as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def write_checkpoint(self, position):
+        # запись во временный файл и переименование атомарны
+        tmp = f'{self.checkpoint}.tmp'
+        with open(tmp, 'w') as f:
+            f.write(str(position))
+        os.replace(tmp, self.checkpoint)
+
+    def resolve_users(self, rows):
+        unknown = {row['user'] for row in rows} - set(self.usernames)
+        if unknown:
+            users = User.objects.filter(username__in=unknown,
+                                        is_active=True)
+            self.usernames.update(users.values_list('username', 'id'))
+
+    def valid_rows(self, rows):
+        valid = []
+        for row in rows:
+            row = {field: (row.get(field) or '').strip() for field in FIELDS}
+            if not row['user'] or not row['title'] or \
+                    not has_valid_extension(row['url']):
+                self.stats['skipped'] += 1
+                continue
+            valid.append(row)
+        self.resolve_users(valid)
+        for row in valid:
+            if row['user'] not in self.usernames:
+                self.stats['skipped'] += 1
+        return [row for row in valid if row['user'] in self.usernames]
+
+    def import_chunk(self, executor, rows):
+        rows = self.valid_rows(rows)
+        for row in rows:
+            row['url_hash'] = url_hash(row['url'])
+        # уже загруженные URL не скачиваются повторно,
+        # повторяющиеся в пачке URL скачиваются один раз
+        results = {
+            image_hash: (name, digest, phash, False)
+            for image_hash, name, digest, phash in Image.objects.filter(
+                url_hash__in={row['url_hash'] for row in rows},
+                status=Image.Status.READY).exclude(image='')
+            .values_list('url_hash', 'image', 'content_hash', 'phash')}
+        self.stats['reused'] += sum(row['url_hash'] in results
+                                    for row in rows)
+        pending = {row['url_hash']: row for row in rows
+                   if row['url_hash'] not in results}
+        downloads = executor.map(download,
+                                 [row['url'] for row in pending.values()],
+                                 [row['title'] for row in pending.values()])
+        results.update(zip(pending, downloads))
+        images = []
+        new_files = {}
+        for row in rows:
+            result = results[row['url_hash']]
+            image = Image(user_id=self.usernames[row['user']],
+                          title=row['title'],
+                          slug=slugify(row['title']),
+                          url=row['url'],
+                          url_hash=row['url_hash'],
+                          description=row['description'])
+            if isinstance(result, IngestError):
+                # неудачные загрузки можно повторить
+                # командой ingest_images --retry-failed
+                image.status = Image.Status.FAILED
+            else:
+                image.image, image.content_hash, image.phash, new_file = result
+                image.status = Image.Status.READY
+                if new_file:
+                    new_files[image.image.name] = image
+            images.append(image)
+        if not images:
+            return
+        with transaction.atomic():
+            Image.objects.bulk_create(images)
+            ready = [image for image in images
+                     if image.status == Image.Status.READY]
+            actions = Action.objects.bulk_create([
+                Action(user_id=image.user_id,
+                       verb='bookmarked image',
+                       target_ct=self.image_ct,
+                       target_id=image.id)
+                for image in ready])
+            # bulk_create() не отправляет сигналы, поэтому счетчики
+            # профилей и поисковый индекс обновляются здесь
+            per_user = Counter(image.user_id for image in images)
+            for user_id, count in per_user.items():
+                Profile.objects.filter(user_id=user_id) \
+                    .update(images_count=F('images_count') + count)
+            index_images(images)
+            # миниатюры нужны только для впервые сохраненных файлов
+            for image in new_files.values():
+                schedule_thumbnails(image.image)
+        fan_out(actions)
+        for image in {image.user_id: image for image in images}.values():
+            invalidate_lists(image)
+        self.stats['ready'] += len(ready)
+        self.stats['failed'] += len(images) - len(ready)
+        self.report()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        total = sum(self.stats[key] for key in ('ready', 'failed', 'skipped'))
+        self.stdout.write(f'{total} row(s) in {elapsed:.1f}s, '
+                          f'{total / max(elapsed, 1e-6):.1f} rows/s '
+                          f'(ready {self.stats["ready"]}, '
+                          f'reused {self.stats["reused"]}, '
+                          f'failed {self.stats["failed"]}, '
+                          f'skipped {self.stats["skipped"]})')
@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from images.ingest import process
+from images.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Скачать файлы изображений, ожидающих загрузки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int,
+                            default=settings.IMAGE_INGEST_WORKERS)
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Повторить загрузку неудавшихся изображений')
+
+    def handle(self, *args, **options):
+        if options['retry_failed']:
+            Image.objects.filter(status=Image.Status.FAILED) \
+                .update(status=Image.Status.PENDING)
+        pending = Image.objects.filter(status=Image.Status.PENDING) \
+            .values_list('id', 'url')
+        total = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for image_id, url in pending.iterator(chunk_size=500):
+                executor.submit(process, image_id, url)
+                total += 1
+        self.stdout.write(self.style.SUCCESS(f'Processed {total} image(s)'))
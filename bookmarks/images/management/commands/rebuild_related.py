@@ -0,0 +1,76 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from bookmarks.redis_client import pipeline
+from images.models import Image
+from images.related import colikes_key, related_key
+
+ImageLike = Image.users_like.through
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать матрицу общих лайков и похожие изображения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Сколько изображений записывать '
+                                 'за один конвейер redis')
+
+    def handle(self, *args, **options):
+        try:
+            import numpy as np
+            from scipy import sparse
+        except ImportError:
+            raise CommandError('rebuild_related requires numpy and scipy: '
+                               'pip install numpy scipy')
+        likes = ImageLike.objects.values_list('user_id', 'image_id')
+        # число строк не задается заранее: лайки могут удаляться,
+        # пока команда читает таблицу
+        pairs = np.fromiter(
+            (value for pair in likes.iterator(chunk_size=10000)
+             for value in pair),
+            dtype=np.int64).reshape(-1, 2)
+        count = len(pairs)
+        # ИД пользователей и изображений заменяются номерами строк
+        # и столбцов матрицы
+        _, user_index = np.unique(pairs[:, 0], return_inverse=True)
+        image_ids, image_index = np.unique(pairs[:, 1], return_inverse=True)
+        likes_matrix = sparse.csr_matrix(
+            (np.ones(count, dtype=np.int32), (user_index, image_index)),
+            shape=(user_index.max(initial=-1) + 1, len(image_ids)))
+        colikes = (likes_matrix.T @ likes_matrix).tocsr()
+        colikes.setdiag(0)
+        colikes.eliminate_zeros()
+        self.stdout.write(f'{count} like(s), {len(image_ids)} image(s), '
+                          f'{colikes.nnz} co-like pair(s)')
+
+        rows = {image_id: row for row, image_id in enumerate(image_ids)}
+        top = settings.IMAGE_RELATED_COUNT
+        written = 0
+        # старые строки удаляются и у изображений, у которых
+        # общих лайков больше нет
+        all_ids = Image.objects.order_by('id') \
+            .values_list('id', flat=True)
+        pipe = pipeline()
+        for image_id in all_ids.iterator(chunk_size=options['chunk_size']):
+            pipe.delete(colikes_key(image_id), related_key(image_id))
+            row = rows.get(image_id)
+            if row is not None:
+                start, end = colikes.indptr[row], colikes.indptr[row + 1]
+                columns = colikes.indices[start:end]
+                values = colikes.data[start:end]
+                if len(values):
+                    pipe.zadd(colikes_key(image_id),
+                              dict(zip(image_ids[columns].tolist(),
+                                       values.tolist())))
+                    # первые top элементов строки без полной сортировки
+                    best = np.argpartition(-values, min(top, len(values)) - 1)
+                    best = best[:top]
+                    pipe.zadd(related_key(image_id),
+                              dict(zip(image_ids[columns[best]].tolist(),
+                                       values[best].tolist())))
+                    written += 1
+            if len(pipe) >= options['chunk_size'] * 2:
+                pipe.execute()
+        pipe.execute()
+        self.stdout.write(self.style.SUCCESS(
+            f'Stored related images for {written} image(s)'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from images.models import Image
+from images.search import FTS_TABLE, fts_available
+
+
+class Command(BaseCommand):
+    help = 'Заново построить полнотекстовый индекс изображений'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not fts_available():
+            raise CommandError('The full-text index is only available '
+                               'on SQLite')
+        rows = Image.objects.order_by('id') \
+            .values_list('id', 'title', 'description')
+        total = 0
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE}')
+            chunk = []
+            for row in rows.iterator(chunk_size=options['chunk_size']):
+                chunk.append(row)
+                if len(chunk) >= options['chunk_size']:
+                    self.insert(cursor, chunk)
+                    total += len(chunk)
+                    chunk = []
+            self.insert(cursor, chunk)
+            total += len(chunk)
+            # объединить сегменты индекса для более быстрого поиска
+            cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) "
+                           f"VALUES ('optimize')")
+        self.stdout.write(self.style.SUCCESS(f'Indexed {total} image(s)'))
+
+    def insert(self, cursor, rows):
+        if rows:
+            cursor.executemany(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+                f'VALUES (%s, %s, %s)', rows)
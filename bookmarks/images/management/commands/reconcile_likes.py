@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, Max
+from images.models import Image
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать total_likes изображений по таблице лайков'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        last_id = Image.objects.aggregate(Max('id'))['id__max'] or 0
+        fixed = 0
+        for start in range(0, last_id + 1, chunk_size):
+            drifted = Image.objects \
+                .filter(id__gte=start, id__lt=start + chunk_size) \
+                .annotate(actual=Count('users_like')) \
+                .exclude(total_likes=F('actual')) \
+                .values_list('id', 'actual')
+            for image_id, actual in drifted:
+                Image.objects.filter(id=image_id) \
+                    .update(total_likes=actual)
+                fixed += 1
+        self.stdout.write(self.style.SUCCESS(f'Fixed {fixed} image(s)'))
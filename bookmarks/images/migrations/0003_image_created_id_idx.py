@@ -0,0 +1,16 @@
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0002_image_total_likes_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['-created', '-id'], name='images_imag_created_2f5292_idx'),
+        ),
+    ]
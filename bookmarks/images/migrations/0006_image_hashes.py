@@ -0,0 +1,60 @@
+import hashlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from django.db import migrations, models
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+# копия images.hashing.url_hash() на момент миграции: миграция
+# не должна меняться вместе с кодом приложения
+def url_hash(url):
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f'{host}:{parts.port}'
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    url = urlunsplit((scheme, host, parts.path or '/', query, ''))
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def hash_urls(apps, schema_editor):
+    Image = apps.get_model('images', 'Image')
+    # строки читаются пачками по диапазонам первичного ключа, поэтому
+    # обновление не выполняется во время чтения открытым курсором
+    last_id = 0
+    while True:
+        batch = list(Image.objects.filter(id__gt=last_id, url_hash='')
+                     .order_by('id').only('id', 'url')[:1000])
+        if not batch:
+            break
+        for image in batch:
+            image.url_hash = url_hash(image.url)
+        Image.objects.bulk_update(batch, ['url_hash'])
+        last_id = batch[-1].id
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0005_image_user_created_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='phash',
+            field=models.CharField(blank=True, max_length=16),
+        ),
+        migrations.AddField(
+            model_name='image',
+            name='url_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.RunPython(hash_urls, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+from django.db import migrations
+
+FTS_TABLE = 'images_image_fts'
+
+
+def create_fts(apps, schema_editor):
+    # FTS5 есть только в SQLite; в других СУБД поиск использует icontains
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+        f"title, description, tokenize='unicode61 remove_diacritics 2')")
+    schema_editor.execute(
+        f'INSERT INTO {FTS_TABLE} (rowid, title, description) '
+        f'SELECT id, title, description FROM images_image')
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('images', '0006_image_hashes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -2,16 +2,31 @@ from django.db import models
 from django.conf import settings
 from django.utils.text import slugify
 from django.urls import reverse
+from .hashing import url_hash
 
 
 class Image(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        READY = 'ready', 'Ready'
+        FAILED = 'failed', 'Failed'
+
     user = models.ForeignKey(settings.AUTH_USER_MODEL,
                              related_name='images_created',
                              on_delete=models.CASCADE)
     title = models.CharField(max_length=200)
     slug = models.SlugField(max_length=200, blank=True)
     url = models.URLField(max_length=2000)
-    image = models.ImageField(upload_to='images/%Y/%m/%d/')
+    # SHA-256 нормализованного URL и содержимого файла
+    url_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+    # разностный хеш изображения для поиска похожих
+    phash = models.CharField(max_length=16, blank=True)
+    image = models.ImageField(upload_to='images/%Y/%m/%d/',
+                              blank=True)
+    status = models.CharField(max_length=10,
+                              choices=Status.choices,
+                              default=Status.READY)
     description = models.TextField(blank=True)
     created = models.DateField(auto_now_add=True)
     users_like = models.ManyToManyField(settings.AUTH_USER_MODEL,
@@ -22,6 +37,8 @@ class Image(models.Model):
     class Meta:
         indexes = [
             models.Index(fields=['-created']),
+            models.Index(fields=['-created', '-id']),
+            models.Index(fields=['user', '-created', '-id']),
             models.Index(fields=['-total_likes']),
         ]
         ordering = ['-created']
@@ -32,6 +49,8 @@ class Image(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.title)
+        if not self.url_hash:
+            self.url_hash = url_hash(self.url)
 
         super().save(*args, **kwargs)
 
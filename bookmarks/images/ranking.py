@@ -0,0 +1,73 @@
+import datetime
+from django.conf import settings
+from django.utils import timezone
+from bookmarks.redis_client import get_redis, pipeline
+
+ALL_TIME_KEY = 'image_ranking'
+PERIODS = ['trending', 'today', 'all']
+
+
+def hour_key(moment):
+    return f'image_ranking:hour:{moment:%Y%m%d%H}'
+
+
+def day_key(moment):
+    return f'image_ranking:day:{moment:%Y%m%d}'
+
+
+def record_views(pipe, views, now=None):
+    """
+    Добавить в конвейер pipe обновление рейтингов для словаря
+    просмотров {ИД изображения: число просмотров}.
+    """
+    now = now or timezone.now()
+    hourly, daily = hour_key(now), day_key(now)
+    for image_id, count in views.items():
+        pipe.zincrby(ALL_TIME_KEY, count, image_id)
+        pipe.zincrby(hourly, count, image_id)
+        pipe.zincrby(daily, count, image_id)
+    pipe.expire(hourly, settings.RANKING_HOURLY_TTL)
+    pipe.expire(daily, settings.RANKING_DAILY_TTL)
+
+
+def _trending_key(now):
+    """
+    Объединить почасовые рейтинги за последние RANKING_TRENDING_HOURS
+    часов с весом, убывающим для более старых часов. Результат
+    хранится RANKING_CACHE_TTL секунд.
+    """
+    key = f'image_ranking:trending:{now:%Y%m%d%H}'
+    if not get_redis().exists(key):
+        weights = {}
+        for hours_ago in range(settings.RANKING_TRENDING_HOURS):
+            moment = now - datetime.timedelta(hours=hours_ago)
+            weights[hour_key(moment)] = settings.RANKING_DECAY ** hours_ago
+        pipe = pipeline()
+        pipe.zunionstore(key, weights)
+        pipe.expire(key, settings.RANKING_CACHE_TTL)
+        pipe.execute()
+    return key
+
+
+def top_image_ids(period, count=10):
+    """
+    Вернуть ИД count самых просматриваемых изображений за период.
+    """
+    now = timezone.now()
+    if period == 'trending':
+        key = _trending_key(now)
+    elif period == 'today':
+        key = day_key(now)
+    else:
+        key = ALL_TIME_KEY
+    return [int(image_id) for image_id in
+            get_redis().zrevrange(key, 0, count - 1)]
+
+
+"""
+Помимо общего рейтинга image_ranking просмотры пишутся в почасовые
+и суточные сортированные множества с ограниченным сроком жизни, поэтому
+старые данные удаляются самим redis. Рейтинг trending вычисляется
+командой ZUNIONSTORE по последним часам с коэффициентом затухания
+RANKING_DECAY и кешируется на RANKING_CACHE_TTL секунд. Из любого
+рейтинга командой ZREVRANGE извлекаются только нужные count элементов."""
@@ -0,0 +1,190 @@
+import logging
+import threading
+from collections import Counter, defaultdict
+import redis
+from django.conf import settings
+from django.db import close_old_connections
+from bookmarks.buffers import PeriodicBuffer
+from bookmarks.redis_client import get_redis, pipeline
+from .models import Image
+
+logger = logging.getLogger(__name__)
+
+ImageLike = Image.users_like.through
+
+
+def colikes_key(image_id):
+    # строка разреженной матрицы: ИД изображения -> число пользователей,
+    # которым понравились оба изображения
+    return f'image:{image_id}:colikes'
+
+
+def related_key(image_id):
+    # IMAGE_RELATED_COUNT изображений с наибольшим числом общих лайков
+    return f'image:{image_id}:related'
+
+
+def _recent_likes(user_id):
+    """
+    ИД изображений, которые понравились пользователю. Берутся только
+    последние IMAGE_COLIKES_USER_LIMIT лайков, чтобы лайк активного
+    пользователя не обновлял тысячи строк; полный расчет выполняет
+    команда rebuild_related.
+    """
+    return set(ImageLike.objects.filter(user_id=user_id).order_by('-id')
+               .values_list('image_id', flat=True)
+               [:settings.IMAGE_COLIKES_USER_LIMIT])
+
+
+def colike_deltas(events):
+    """
+    Вычислить изменения матрицы общих лайков для событий
+    (ИД изображения, ИД пользователя, +1 или -1) в порядке их
+    совершения. Множество лайков пользователя на момент каждого
+    события восстанавливается от текущего состояния в обратном
+    порядке, поэтому пара лайков одной пачки учитывается один раз.
+    """
+    by_user = defaultdict(list)
+    for image_id, user_id, amount in events:
+        by_user[user_id].append((image_id, amount))
+    deltas = Counter()
+    for user_id, user_events in by_user.items():
+        liked = _recent_likes(user_id)
+        for image_id, amount in reversed(user_events):
+            # множество лайков до события
+            if amount > 0:
+                liked.discard(image_id)
+            else:
+                liked.add(image_id)
+            for other_id in liked - {image_id}:
+                deltas[image_id, other_id] += amount
+                deltas[other_id, image_id] += amount
+    return {pair: amount for pair, amount in deltas.items() if amount}
+
+
+def apply_deltas(deltas):
+    """
+    Применить изменения к строкам матрицы в redis и обновить
+    списки похожих изображений.
+    """
+    pairs = list(deltas.items())
+    pipe = pipeline()
+    for (image_id, other_id), amount in pairs:
+        pipe.zincrby(colikes_key(image_id), amount, other_id)
+    scores = pipe.execute()
+    count = settings.IMAGE_RELATED_COUNT
+    refill = set()
+    pipe = pipeline()
+    for ((image_id, other_id), amount), score in zip(pairs, scores):
+        if score <= 0:
+            pipe.zrem(colikes_key(image_id), other_id)
+            pipe.zrem(related_key(image_id), other_id)
+            refill.add(image_id)
+        elif amount > 0:
+            # рост элемента может только поднять его в первые count,
+            # поэтому достаточно добавить его и отрезать лишние
+            pipe.zadd(related_key(image_id), {other_id: score})
+            pipe.zremrangebyrank(related_key(image_id), 0, -count - 1)
+        else:
+            refill.add(image_id)
+    pipe.execute()
+    if not refill:
+        return
+    # после уменьшения элемента его может обогнать элемент, не вошедший
+    # в список, поэтому списки заново берутся из строк матрицы
+    refill = list(refill)
+    pipe = pipeline()
+    for image_id in refill:
+        pipe.zrevrange(colikes_key(image_id), 0, count - 1, withscores=True)
+    tops = pipe.execute()
+    pipe = pipeline()
+    for image_id, top in zip(refill, tops):
+        pipe.delete(related_key(image_id))
+        if top:
+            pipe.zadd(related_key(image_id), dict(top))
+    pipe.execute()
+
+
+class ColikeBuffer(PeriodicBuffer):
+    """
+    Накапливает лайки и снятия лайков и обновляет матрицу общих
+    лайков в фоновом потоке, а не в запросе image_like.
+    """
+
+    interval_setting = 'IMAGE_COLIKES_FLUSH_INTERVAL'
+    size_setting = 'IMAGE_COLIKES_FLUSH_SIZE'
+
+    def __init__(self):
+        super().__init__()
+        self.events = []
+
+    def add(self, image_id, user_id, amount):
+        if self.interval <= 0:
+            self.write([(image_id, user_id, amount)])
+            return
+        with self.lock:
+            self.events.append((image_id, user_id, amount))
+            size = len(self.events)
+        self.added(size)
+
+    def drain(self):
+        events, self.events = self.events, []
+        return events
+
+    def write(self, events):
+        try:
+            deltas = colike_deltas(events)
+            if deltas:
+                apply_deltas(deltas)
+        except redis.RedisError:
+            # пропущенные изменения восстановит команда rebuild_related
+            logger.exception('Could not update co-likes for %s like(s)',
+                             len(events))
+        finally:
+            if threading.current_thread() is self.thread:
+                close_old_connections()
+
+
+colike_buffer = ColikeBuffer()
+
+
+def record_like(image_id, user_id):
+    colike_buffer.add(image_id, user_id, 1)
+
+
+def record_unlike(image_id, user_id):
+    colike_buffer.add(image_id, user_id, -1)
+
+
+def related_images(image_id, count=None):
+    """
+    Вернуть изображения, которые чаще всего нравились тем же
+    пользователям, что и это изображение: одна команда redis
+    и один запрос к базе данных.
+    """
+    count = count or settings.IMAGE_RELATED_COUNT
+    try:
+        related_ids = [int(related_id) for related_id in
+                       get_redis().zrevrange(related_key(image_id),
+                                             0, count - 1)]
+    except redis.RedisError:
+        return []
+    images = Image.objects.filter(status=Image.Status.READY) \
+        .in_bulk(related_ids)
+    return [images[related_id] for related_id in related_ids
+            if related_id in images]
+
+
+"""
+Матрица совместных лайков C = Aᵀ·A, где A - матрица «пользователь x
+изображение» из таблицы images_image_users_like, хранится в redis по
+строкам: сортированное множество image:<id>:colikes содержит ненулевые
+элементы строки изображения. Лайки и снятия лайков копятся в буфере
+и раз в IMAGE_COLIKES_FLUSH_INTERVAL секунд применяются к строкам
+в фоновом потоке, поэтому запрос image_like не выполняет ни одной
+дополнительной команды redis. Первые IMAGE_RELATED_COUNT элементов
+строки поддерживаются отдельно в image:<id>:related, и страница
+изображения читает готовый список одной командой ZREVRANGE. Каждый
+процесс ведет свой буфер, поэтому одновременные лайки одного
+пользователя в разных процессах могут учитываться неточно; матрицу
+целиком пересчитывает команда rebuild_related средствами NumPy и SciPy."""
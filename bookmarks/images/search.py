@@ -0,0 +1,165 @@
+import base64
+import json
+import re
+from django.db import connection
+from django.db.models import Q
+from django.template.loader import render_to_string
+from bookmarks.pagination import InvalidCursor, KeysetPage, KeysetPaginator
+from .models import Image
+
+FTS_TABLE = 'images_image_fts'
+# вес совпадений в заголовке и в описании для bm25()
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+PER_PAGE = 8
+# сколько изображений индексировать одним запросом
+INDEX_CHUNK_SIZE = 300
+
+
+def fts_available():
+    """
+    Полнотекстовый индекс FTS5 создается только в SQLite.
+    """
+    return connection.vendor == 'sqlite'
+
+
+def index_images(images):
+    """
+    Добавить или обновить изображения в полнотекстовом индексе.
+    """
+    if not fts_available() or not images:
+        return
+    # многострочные запросы вместо executemany(): параметры остаются
+    # плоским списком, который понимают и отладочные инструменты,
+    # записывающие выполненные запросы; пачки не превышают
+    # ограничение SQLite на число параметров запроса
+    with connection.cursor() as cursor:
+        for start in range(0, len(images), INDEX_CHUNK_SIZE):
+            chunk = images[start:start + INDEX_CHUNK_SIZE]
+            ids = [image.id for image in chunk]
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN '
+                           f'({", ".join(["%s"] * len(ids))})', ids)
+            params = [value for image in chunk
+                      for value in (image.id, image.title,
+                                    image.description)]
+            cursor.execute(f'INSERT INTO {FTS_TABLE} '
+                           f'(rowid, title, description) VALUES '
+                           f'{", ".join(["(%s, %s, %s)"] * len(chunk))}',
+                           params)
+
+
+def unindex_image(image_id):
+    if not fts_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+                       [image_id])
+
+
+def fts_query(text):
+    """
+    Преобразовать введенный текст в запрос FTS5: каждое слово берется
+    в кавычки, чтобы операторы FTS5 не нарушали синтаксис, последнее
+    слово ищется как префикс. Все слова должны встречаться в записи.
+    """
+    words = re.findall(r'\w+', text.lower())
+    if not words:
+        return ''
+    return ' '.join(f'"{word}"' for word in words) + '*'
+
+
+def encode_cursor(score, image_id):
+    data = json.dumps([score, image_id], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        padding = '=' * (-len(cursor) % 4)
+        score, image_id = json.loads(base64.urlsafe_b64decode(
+            cursor + padding))
+        return float(score), int(image_id)
+    except Exception:
+        raise InvalidCursor(cursor)
+
+
+def _fts_page(text, cursor, per_page):
+    match = fts_query(text)
+    if not match:
+        return KeysetPage([], None)
+    score = f'bm25({FTS_TABLE}, {TITLE_WEIGHT}, {DESCRIPTION_WEIGHT})'
+    table = Image._meta.db_table
+    rowid = f'{FTS_TABLE}.rowid'
+    # статус проверяется до LIMIT, иначе неготовые изображения
+    # занимали бы места на странице и она могла оказаться пустой
+    sql = f'SELECT {rowid}, {score} FROM {FTS_TABLE} ' \
+          f'JOIN {table} ON {table}.id = {rowid} ' \
+          f'WHERE {FTS_TABLE} MATCH %s AND {table}.status = %s'
+    params = [match, Image.Status.READY]
+    if cursor:
+        # меньшее значение bm25() означает более релевантную запись
+        last_score, last_id = decode_cursor(cursor)
+        sql += f' AND ({score} > %s OR ({score} = %s AND {rowid} > %s))'
+        params += [last_score, last_score, last_id]
+    sql += f' ORDER BY {score}, {rowid} LIMIT %s'
+    params.append(per_page + 1)
+    with connection.cursor() as db_cursor:
+        db_cursor.execute(sql, params)
+        rows = db_cursor.fetchall()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+    ids = [image_id for image_id, _ in rows]
+    # изображение могло измениться после выполнения запроса
+    images = Image.objects.filter(status=Image.Status.READY).in_bulk(ids)
+    return KeysetPage([images[image_id] for image_id in ids
+                       if image_id in images], next_cursor)
+
+
+def _icontains_page(text, cursor, per_page):
+    # без FTS5 выполняется поиск перебором таблицы, без ранжирования
+    condition = Q()
+    for word in text.split():
+        condition &= Q(title__icontains=word) | \
+            Q(description__icontains=word)
+    images = Image.objects.filter(condition, status=Image.Status.READY)
+    return KeysetPaginator(images, per_page).page(cursor)
+
+
+def search_images(text, cursor=None, per_page=PER_PAGE):
+    """
+    Вернуть страницу изображений, найденных по заголовку и описанию,
+    в порядке релевантности. Для испорченного курсора возбуждается
+    InvalidCursor.
+    """
+    if fts_available():
+        return _fts_page(text, cursor, per_page)
+    return _icontains_page(text, cursor, per_page)
+
+
+def render_search_page(text, cursor=None):
+    """
+    Вернуть HTML страницы результатов поиска и курсор следующей страницы.
+    """
+    page = search_images(text, cursor)
+    if not page:
+        return '', None
+    html = render_to_string('images/image/list_images.html',
+                            {'images': page})
+    return html, page.next_cursor
+
+
+"""
+Поиск выполняется по инвертированному индексу SQLite FTS5: виртуальная
+таблица images_image_fts хранит для каждого слова список изображений,
+в заголовке или описании которых оно встречается, поэтому запрос
+не перебирает всю таблицу images_image, как LIKE '%...%' при фильтре
+icontains. Результаты упорядочиваются функцией bm25(), совпадения
+в заголовке весят больше. Для постраничной разбивки курсор содержит
+значение bm25() и ИД последнего изображения страницы. В индекс попадают
+изображения с любым статусом, а готовые отбираются соединением
+с images_image в том же запросе, до LIMIT. Индекс обновляется
+обработчиками сигналов post_save и post_delete модели Image, а после
+массовой вставки bulk_create() - вызовом index_images(). Заново
+построить индекс можно командой rebuild_search_index."""
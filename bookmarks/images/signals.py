@@ -0,0 +1,53 @@
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from easy_thumbnails.signals import saved_file
+from account.models import Profile
+from .fragments import invalidate_lists
+from .models import Image
+from .search import index_images, unindex_image
+from .thumbnails import schedule, thumbnails_generated
+
+
+@receiver(saved_file)
+def generate_thumbnails(sender, fieldfile, **kwargs):
+    schedule(fieldfile)
+
+
+@receiver(post_save, sender=Image)
+def image_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Profile.objects.filter(user_id=instance.user_id) \
+            .update(images_count=F('images_count') + 1)
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted(sender, instance, **kwargs):
+    Profile.objects.filter(user_id=instance.user_id, images_count__gt=0) \
+        .update(images_count=F('images_count') - 1)
+
+
+@receiver(post_save, sender=Image)
+@receiver(post_delete, sender=Image)
+@receiver(thumbnails_generated, sender=Image)
+def image_changed(sender, instance, **kwargs):
+    invalidate_lists(instance)
+
+
+@receiver(post_save, sender=Image)
+def image_saved_to_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_images([instance])
+
+
+@receiver(post_delete, sender=Image)
+def image_deleted_from_index(sender, instance, **kwargs):
+    unindex_image(instance.id)
+
+
+"""
+Счетчик изображений профиля обновляется выражением F() при создании
+и удалении изображения, поэтому странице пользователя и дашборду не нужен
+запрос COUNT по таблице images_image. Сигналы не вызываются методом
+bulk_create(), поэтому массовый импорт увеличивает счетчик и добавляет
+изображения в полнотекстовый индекс сам."""
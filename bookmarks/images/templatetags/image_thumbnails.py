@@ -0,0 +1,34 @@
+from django import template
+from django.templatetags.static import static
+from easy_thumbnails.alias import aliases
+from easy_thumbnails.files import get_thumbnailer
+from images.thumbnails import schedule
+
+register = template.Library()
+
+PLACEHOLDER = 'img/placeholder.svg'
+
+
+@register.filter
+def thumbnail_alias(fieldfile, alias):
+    """
+    Вернуть URL-адрес уже сгенерированной миниатюры либо заглушки.
+    Сама миниатюра во время запроса не создается.
+
+    Пример использования::
+
+        <img src="{{ image.image|thumbnail_alias:'list' }}">
+    """
+    if not fieldfile:
+        return static(PLACEHOLDER)
+    thumbnailer = get_thumbnailer(fieldfile)
+    options = aliases.get(alias, target=thumbnailer.alias_target)
+    if not options:
+        return static(PLACEHOLDER)
+    options['ALIAS'] = alias
+    thumbnail = thumbnailer.get_existing_thumbnail(options)
+    if thumbnail is None:
+        # миниатюры еще нет: создать ее в фоне
+        schedule(fieldfile)
+        return static(PLACEHOLDER)
+    return thumbnail.url
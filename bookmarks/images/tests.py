@@ -1,3 +1,464 @@
-from django.test import TestCase
+from collections import Counter
+import io
+import tempfile
+import threading
+from itertools import permutations
+from unittest import mock, skipIf
+import redis
+from PIL import Image as PILImage
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.urls import reverse
+from bookmarks.pagination import InvalidCursor, KeysetPaginator
+from bookmarks.redis_client import get_redis, pipeline
+from bookmarks.testing import MemoryRedisTestCase
+from bookmarks.versions import bump_version, get_versions
+from .counters import ViewCounterBuffer, views_key
+from .fragments import LIST_VERSION_KEY, render_images_page
+from .hashing import normalize_url, url_hash
+from .ingest import HostLimiter, ingest, store
+from .likes import like_image, unlike_image
+from .models import Image
+from .ranking import PERIODS, record_views, top_image_ids
+from .related import ImageLike, colike_deltas, related_images
+from .search import INDEX_CHUNK_SIZE, fts_available, index_images, \
+    render_search_page, search_images
 
-# Create your tests here.
+try:
+    from debug_toolbar.panels.sql.tracking import wrap_cursor
+except ImportError:
+    wrap_cursor = None
+
+
+def create_images(user, count, **fields):
+    return [Image.objects.create(user=user, title=f'Image {i}',
+                                 url=f'https://example.com/{i}.png',
+                                 **fields)
+            for i in range(count)]
+
+
+class KeysetPaginatorTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('alice')
+        # у всех изображений одна дата создания, порядок задает id
+        create_images(self.user, 11)
+
+    def test_pages_cover_all_objects_once(self):
+        paginator = KeysetPaginator(Image.objects.all(), 4)
+        ids = []
+        cursor = None
+        pages = 0
+        while True:
+            page = paginator.page(cursor)
+            ids += [image.id for image in page]
+            pages += 1
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(pages, 3)
+        self.assertEqual(ids, list(Image.objects.order_by('-created', '-id')
+                                   .values_list('id', flat=True)))
+
+    def test_page_after_new_object(self):
+        # новое изображение не сдвигает следующие страницы
+        paginator = KeysetPaginator(Image.objects.all(), 4)
+        first = paginator.page()
+        create_images(self.user, 1)
+        second = paginator.page(first.next_cursor)
+        self.assertTrue(set(image.id for image in first)
+                        .isdisjoint(image.id for image in second))
+        self.assertLess(max(image.id for image in second),
+                        min(image.id for image in first))
+
+    def test_invalid_cursor(self):
+        paginator = KeysetPaginator(Image.objects.all(), 4)
+        for cursor in ['garbage', 'WyIxIl0']:
+            with self.assertRaises(InvalidCursor):
+                paginator.page(cursor)
+
+
+class VersionedCacheTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('bob')
+
+    def test_bump_version(self):
+        self.assertEqual(get_versions('a', 'b'), [0, 0])
+        bump_version('a')
+        bump_version('a', 'b')
+        self.assertEqual(get_versions('a', 'b'), [2, 1])
+
+    def test_saved_image_invalidates_pages(self):
+        create_images(self.user, 2)
+        version, = get_versions(LIST_VERSION_KEY)
+        html, _ = render_images_page()
+        self.assertIn('Image 1', html)
+        with self.assertNumQueries(0):
+            self.assertEqual(render_images_page()[0], html)
+        image = Image.objects.create(user=self.user, title='Fresh image',
+                                     url='https://example.com/fresh.png')
+        self.assertGreater(get_versions(LIST_VERSION_KEY)[0], version)
+        self.assertIn('Fresh image', render_images_page()[0])
+        self.assertIn('Fresh image', render_images_page(self.user.id)[0])
+        image.delete()
+        self.assertNotIn('Fresh image', render_images_page()[0])
+
+
+class QueryRecorder:
+    """
+    Заменяет панель SQL debug toolbar: принимает записанные запросы.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def record(self, **kwargs):
+        self.queries.append(kwargs)
+
+
+class SearchIndexTests(MemoryRedisTestCase):
+    def setUp(self):
+        if not fts_available():
+            self.skipTest('The full-text index is only available on SQLite')
+        super().setUp()
+        self.user = User.objects.create_user('carol')
+
+    def found(self, text, per_page=8):
+        return [image.title for image in search_images(text,
+                                                       per_page=per_page)]
+
+    def test_receivers_keep_index_current(self):
+        image = Image.objects.create(user=self.user, title='Red bicycle',
+                                     url='https://example.com/bike.png',
+                                     description='parked by the river')
+        self.assertEqual(self.found('bicycle'), ['Red bicycle'])
+        self.assertEqual(self.found('riv'), ['Red bicycle'])
+        image.title = 'Blue boat'
+        image.save()
+        self.assertEqual(self.found('bicycle'), [])
+        self.assertEqual(self.found('boat'), ['Blue boat'])
+        image.delete()
+        self.assertEqual(self.found('boat'), [])
+
+    def test_images_that_are_not_ready_do_not_fill_pages(self):
+        # заголовок неудачных импортов совпадает лучше, чем у готового
+        for i in range(9):
+            Image.objects.create(user=self.user, title='Sunset beach',
+                                 url=f'https://example.com/failed/{i}.png',
+                                 status=Image.Status.FAILED)
+        Image.objects.create(user=self.user, title='Beach at dawn',
+                             url='https://example.com/ready.png',
+                             description='a sunset over the sea')
+        self.assertEqual(self.found('sunset beach', per_page=2),
+                         ['Beach at dawn'])
+        html, cursor = render_search_page('sunset beach')
+        self.assertIn('Beach at dawn', html)
+        self.assertIsNone(cursor)
+
+    def test_next_page_cursor(self):
+        for i in range(5):
+            Image.objects.create(user=self.user, title=f'Tulip {i}',
+                                 url=f'https://example.com/tulip/{i}.png')
+        first = search_images('tulip', per_page=3)
+        second = search_images('tulip', first.next_cursor, per_page=3)
+        self.assertEqual(len(first) + len(second), 5)
+        self.assertIsNone(second.next_cursor)
+
+    def wrap_cursor(self, recorder):
+        """
+        Обернуть курсор соединения так же, как панель SQL debug
+        toolbar, и вернуть исходный курсор после теста.
+        """
+        patched = ['cursor', 'chunked_cursor', '_djdt_cursor',
+                   '_djdt_chunked_cursor', '_djdt_logger']
+        saved = {name: connection.__dict__[name] for name in patched
+                 if name in connection.__dict__}
+
+        def unwrap():
+            for name in patched:
+                connection.__dict__.pop(name, None)
+            connection.__dict__.update(saved)
+        self.addCleanup(unwrap)
+        wrap_cursor(connection)
+        connection._djdt_logger = recorder
+
+    @skipIf(wrap_cursor is None, 'django-debug-toolbar is not installed')
+    def test_receiver_under_debug_toolbar(self):
+        # панель записывает параметры каждого запроса
+        recorder = QueryRecorder()
+        self.wrap_cursor(recorder)
+        Image.objects.create(user=self.user, title='Green kite',
+                             url='https://example.com/kite.png')
+        connection._djdt_logger = None
+        self.assertTrue(any('images_image_fts' in query['sql']
+                            for query in recorder.queries))
+        self.assertEqual(self.found('kite'), ['Green kite'])
+
+    def test_index_images_in_chunks(self):
+        images = Image.objects.bulk_create(
+            [Image(user=self.user, title=f'Lamp {i}',
+                   url=f'https://example.com/lamp/{i}.png')
+             for i in range(INDEX_CHUNK_SIZE + 5)])
+        index_images(images)
+        # повторная индексация заменяет записи, а не дублирует их
+        index_images(images[:10])
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM images_image_fts '
+                           'WHERE images_image_fts MATCH %s', ['lamp'])
+            self.assertEqual(cursor.fetchone()[0], len(images))
+
+
+def colike_counts(likes):
+    """
+    Матрица общих лайков, посчитанная перебором по множествам
+    лайков пользователей.
+    """
+    counts = Counter()
+    for liked in likes.values():
+        counts.update(permutations(liked, 2))
+    return counts
+
+
+class RelatedImagesTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.users = [User.objects.create_user(f'user{i}') for i in range(3)]
+        self.images = create_images(self.users[0], 4)
+
+    def test_deltas_match_brute_force(self):
+        a, b, c, d = [image.id for image in self.images]
+        first, second = [user.id for user in self.users[:2]]
+        before = {first: {a}, second: {a, b}}
+        events = [(b, first, 1), (c, first, 1), (b, first, -1),
+                  (d, first, 1), (b, first, 1),
+                  (a, second, -1), (c, second, 1)]
+        after = {user_id: set(liked) for user_id, liked in before.items()}
+        for image_id, user_id, amount in events:
+            if amount > 0:
+                after[user_id].add(image_id)
+            else:
+                after[user_id].discard(image_id)
+        ImageLike.objects.bulk_create(
+            ImageLike(image_id=image_id, user_id=user_id)
+            for user_id, liked in after.items() for image_id in liked)
+        # изменения пачки равны разности матриц до и после нее
+        expected = colike_counts(after)
+        expected.subtract(colike_counts(before))
+        self.assertEqual(colike_deltas(events),
+                         {pair: amount for pair, amount in expected.items()
+                          if amount})
+
+    def test_related_images(self):
+        a, b, c, d = self.images
+        for user in self.users:
+            like_image(a, user)
+            like_image(b, user)
+        like_image(c, self.users[0])
+        like_image(d, self.users[1])
+        like_image(d, self.users[2])
+        self.assertEqual(related_images(a.id), [b, d, c])
+        for user in self.users:
+            unlike_image(b, user)
+        # изображение без общих лайков уходит из списка
+        self.assertEqual(related_images(a.id), [d, c])
+        self.assertEqual(related_images(c.id), [a])
+
+
+# поток сброса не срабатывает сам, буфер сбрасывается в тестах явно
+@override_settings(VIEW_COUNTER_FLUSH_INTERVAL=60)
+class ViewCounterTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.counter = ViewCounterBuffer()
+
+    def test_pending_views_are_counted(self):
+        self.counter.incr(1)
+        self.counter.incr(1)
+        self.assertEqual(self.counter.get(1), 2)
+        self.assertIsNone(get_redis().get(views_key(1)))
+        self.counter.flush()
+        self.assertEqual(int(get_redis().get(views_key(1))), 2)
+        self.counter.incr(1)
+        self.assertEqual(self.counter.get(1), 3)
+        self.assertEqual(self.counter.get(2), 0)
+
+    def test_get_without_redis(self):
+        get_redis().set(views_key(1), 5)
+        self.assertEqual(self.counter.get(1), 5)
+        self.counter.incr(1)
+        self.counter.incr(2)
+        with override_settings(VIEW_COUNTER_TOTALS_TTL=0), \
+                mock.patch('images.counters.get_redis',
+                           side_effect=redis.ConnectionError), \
+                self.assertLogs('images.counters', 'WARNING'):
+            self.assertEqual(self.counter.get(1), 6)
+            self.assertEqual(self.counter.get(2), 1)
+
+    def test_failed_flush_keeps_views(self):
+        self.counter.incr(1)
+        pipe = pipeline()
+        with mock.patch.object(pipe, 'execute',
+                               side_effect=redis.ConnectionError), \
+                mock.patch('images.counters.pipeline', return_value=pipe), \
+                self.assertLogs('images.counters', 'ERROR'):
+            self.counter.flush()
+        self.assertEqual(self.counter.get(1), 1)
+        self.counter.flush()
+        self.assertEqual(int(get_redis().get(views_key(1))), 1)
+
+
+class RankingTests(MemoryRedisTestCase):
+    def test_top_images(self):
+        pipe = pipeline()
+        record_views(pipe, {1: 3, 2: 5, 3: 1})
+        pipe.execute()
+        for period in PERIODS:
+            self.assertEqual(top_image_ids(period, 2), [2, 1])
+        pipe = pipeline()
+        record_views(pipe, {3: 10})
+        pipe.execute()
+        self.assertEqual(top_image_ids('all', 2), [3, 2])
+
+
+class HostLimiterTests(SimpleTestCase):
+    def setUp(self):
+        self.limiter = HostLimiter(2)
+
+    def test_limit_per_host(self):
+        self.assertTrue(self.limiter.acquire('a.com'))
+        self.assertTrue(self.limiter.acquire('a.com'))
+        self.assertFalse(self.limiter.acquire('a.com'))
+        self.assertTrue(self.limiter.acquire('b.com'))
+
+    def test_deferred_tasks(self):
+        done = []
+        for i in range(4):
+            if self.limiter.acquire_or_defer('a.com',
+                                             lambda i=i: done.append(i)):
+                done.append(f'started {i}')
+        self.assertEqual(done, ['started 0', 'started 1'])
+        # освободившееся место переходит первой задаче в очереди
+        self.limiter.release('a.com')
+        self.assertEqual(done[2:], [2])
+        self.assertFalse(self.limiter.acquire('a.com'))
+        for _ in range(3):
+            self.limiter.release('a.com')
+        self.assertEqual(done[2:], [2, 3])
+        # хост без загрузок и очереди удаляется из словарей
+        self.assertEqual(self.limiter.active, {})
+        self.assertEqual(self.limiter.waiting, {})
+
+    def test_blocking_acquire(self):
+        self.limiter.acquire('a.com')
+        self.limiter.acquire('a.com')
+        acquired = threading.Event()
+
+        def wait():
+            self.limiter.acquire('a.com', blocking=True)
+            acquired.set()
+        thread = threading.Thread(target=wait)
+        thread.start()
+        self.assertFalse(acquired.wait(0.05))
+        self.limiter.release('a.com')
+        self.assertTrue(acquired.wait(5))
+        thread.join()
+        self.assertEqual(self.limiter.active, {'a.com': 2})
+
+
+class LikeCounterTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('gina')
+        self.image, = create_images(self.user, 1)
+        self.client.force_login(self.user)
+
+    def post(self, action):
+        response = self.client.post(reverse('images:like'),
+                                    {'id': self.image.id, 'action': action})
+        self.assertEqual(response.json(), {'status': 'ok'})
+        self.image.refresh_from_db()
+
+    def test_like_and_unlike(self):
+        self.post('like')
+        self.post('like')
+        self.assertEqual(self.image.total_likes, 1)
+        self.assertEqual(list(self.image.users_like.all()), [self.user])
+        self.post('unlike')
+        self.post('unlike')
+        self.assertEqual(self.image.total_likes, 0)
+        self.assertFalse(self.image.users_like.exists())
+
+    def test_reconcile_likes(self):
+        other, = create_images(self.user, 1)
+        like_image(self.image, self.user)
+        Image.objects.update(total_likes=5)
+        output = io.StringIO()
+        call_command('reconcile_likes', chunk_size=1, stdout=output)
+        self.assertIn('Fixed 2 image(s)', output.getvalue())
+        self.assertEqual(dict(Image.objects.values_list('id', 'total_likes')),
+                         {self.image.id: 1, other.id: 0})
+
+
+class StoredFileTests(MemoryRedisTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.user = User.objects.create_user('ivan')
+        buffer = io.BytesIO()
+        PILImage.new('RGB', (16, 16), 'red').save(buffer, 'PNG')
+        self.content = buffer.getvalue()
+
+    def create(self, url, **fields):
+        return Image.objects.create(user=self.user, title='Red square',
+                                    url=url, **fields)
+
+    def test_normalize_url(self):
+        self.assertEqual(
+            normalize_url(' HTTPS://Example.COM:443/a.png?b=2&a=1#top '),
+            'https://example.com/a.png?a=1&b=2')
+        self.assertEqual(normalize_url('http://example.com:8080'),
+                         'http://example.com:8080/')
+        image = self.create('https://EXAMPLE.com/a.png?b=2&a=1')
+        self.assertEqual(image.url_hash,
+                         url_hash('https://example.com/a.png?a=1&b=2'))
+
+    def test_store_reuses_content(self):
+        name, digest, _, created = store(self.content, 'png', 'red')
+        self.assertTrue(created)
+        self.create('https://example.com/red.png', image=name,
+                    content_hash=digest)
+        self.assertEqual(store(self.content, 'png', 'copy'),
+                         (name, digest, '', False))
+
+    def test_ingest_reuses_url(self):
+        name, digest, _, _ = store(self.content, 'png', 'red')
+        self.create('https://example.com/red.png', image=name,
+                    content_hash=digest)
+        image = self.create('https://EXAMPLE.com/red.png#copy',
+                            status=Image.Status.PENDING)
+        # файл по известному URL не скачивается повторно
+        with mock.patch('images.ingest.fetch', side_effect=AssertionError):
+            ingest(image.id)
+        image.refresh_from_db()
+        self.assertEqual(image.status, Image.Status.READY)
+        self.assertEqual(image.image.name, name)
+
+    def test_ingest_reuses_content(self):
+        name, digest, _, _ = store(self.content, 'png', 'red')
+        self.create('https://example.com/red.png', image=name,
+                    content_hash=digest)
+        image = self.create('https://mirror.example.com/red.png',
+                            status=Image.Status.PENDING)
+        with mock.patch('images.ingest.fetch',
+                        return_value=(self.content, 'png')):
+            ingest(image.id)
+        image.refresh_from_db()
+        self.assertEqual(image.image.name, name)
+        self.assertEqual(image.content_hash, digest)
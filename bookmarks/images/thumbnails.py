@@ -0,0 +1,70 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.apps import apps
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.dispatch import Signal
+from easy_thumbnails.files import generate_all_aliases
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_lock = threading.Lock()
+# файлы, для которых генерация уже запланирована
+_scheduled = set()
+
+# отправляется после генерации миниатюр объекта
+thumbnails_generated = Signal()
+
+
+def get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS,
+                thread_name_prefix='thumbnails')
+    return _executor
+
+
+def generate(model_label, pk, field_name):
+    """
+    Сгенерировать все миниатюры из THUMBNAIL_ALIASES для поля объекта.
+    """
+    try:
+        model = apps.get_model(model_label)
+        instance = model.objects.filter(pk=pk).first()
+        fieldfile = getattr(instance, field_name, None)
+        if fieldfile:
+            generate_all_aliases(fieldfile, include_global=False)
+            thumbnails_generated.send(sender=model, instance=instance,
+                                      field_name=field_name)
+    except Exception:
+        logger.exception('Thumbnail generation failed for %s %s',
+                         model_label, pk)
+    finally:
+        with _lock:
+            _scheduled.discard((model_label, pk, field_name))
+        close_old_connections()
+
+
+def schedule(fieldfile):
+    """
+    Поставить генерацию миниатюр файла в пул после фиксации транзакции.
+    """
+    instance = fieldfile.instance
+    key = (instance._meta.label, instance.pk, fieldfile.field.name)
+    with _lock:
+        if key in _scheduled:
+            return
+        _scheduled.add(key)
+    transaction.on_commit(lambda: get_executor().submit(generate, *key))
+
+
+"""
+Миниатюры, объявленные в THUMBNAIL_ALIASES, генерируются заранее: после
+загрузки файла изображения (images.ingest) и после сохранения фотографии
+профиля (сигнал saved_file из easy_thumbnails). Шаблоны только ищут уже
+готовые миниатюры фильтром thumbnail_alias и вместо отсутствующих
+показывают заглушку, не выполняя обработку изображения во время запроса."""
@@ -2,20 +2,20 @@ from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import ImageCreateForm
+from .ingest import enqueue
+from .counters import view_counter
+from .ranking import PERIODS, top_image_ids
+from .likes import like_image, unlike_image
+from .related import related_images
+from .search import render_search_page
+from .fragments import render_images_page
 from django.shortcuts import get_object_or_404
 from .models import Image
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.http import HttpResponse
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from bookmarks.pagination import InvalidCursor
 from actions.utils import create_action
-import redis
-from django.conf import settings
-
-# соединить с redis
-r = redis.Redis(host=settings.REDIS_HOST,
-                port=settings.REDIS_PORT,
-                db=settings.REDIS_DB)
 
 
 @login_required
@@ -26,15 +26,17 @@ def image_create(request):
         if form.is_valid():  # данные в форме валидны
             cd = form.cleaned_data
             new_image = form.save(commit=False)
-        # назначить текущего пользователя элементу
-        new_image.user = request.user
-        new_image.save()
-        create_action(request.user, 'bookmarked image', new_image)
-        messages.success(request,
-                         'Image added successfully')
-        # перенаправить к представлению детальной
-        # информации о только что созданном элементе
-        return redirect(new_image.get_absolute_url())
+            # назначить текущего пользователя элементу
+            new_image.user = request.user
+            new_image.save()
+            # скачать файл изображения в фоне
+            enqueue(new_image)
+            create_action(request.user, 'bookmarked image', new_image)
+            messages.success(request,
+                             'Image added successfully')
+            # перенаправить к представлению детальной
+            # информации о только что созданном элементе
+            return redirect(new_image.get_absolute_url())
 
     else:
         # скомпоновать форму с данными,
@@ -73,14 +75,15 @@ def image_create(request):
 
 def image_detail(request, id, slug):
     image = get_object_or_404(Image, id=id, slug=slug)
-    # увеличить общее число просмотров изображения на 1
-    total_views = r.incr(f'image:{image.id}:views')
-    r.zincrby('image_ranking', 1,
-              image.id)  # Команда zincrby() используется для сохранения просмотров изображений в сортированном множестве с ключом image:ranking.
+    # увеличить общее число просмотров изображения на 1;
+    # запись в redis выполняется пакетами в фоне
+    view_counter.incr(image.id)
+    total_views = view_counter.get(image.id)
     return render(request, 'images/image/detail.html',
                   {'section': 'images',
                    'image': image,
-                   'total_views': total_views})
+                   'total_views': total_views,
+                   'related_images': related_images(image.id)})
 
 
 @login_required
@@ -90,12 +93,12 @@ def image_like(request):
     action = request.POST.get('action')
     if image_id and action:
         try:
-            image = Image.objects.get(id=image_id)
+            image = Image.objects.only('id').get(id=image_id)
             if action == 'like':
-                image.users_like.add(request.user)
-                create_action(request.user, 'likes', image)
+                if like_image(image, request.user):
+                    create_action(request.user, 'likes', image)
             else:
-                image.users_like.remove(request.user)
+                unlike_image(image, request.user)
             return JsonResponse({'status': 'ok'})
         except Image.DoesNotExist:
             pass
@@ -104,34 +107,30 @@ def image_like(request):
 
 @login_required
 def image_list(request):
-    images = Image.objects.all()
-    paginator = Paginator(images, 8)
-    page = request.GET.get('page')
+    user_id = request.GET.get('user')
+    if user_id is not None and not user_id.isdigit():
+        return HttpResponse('')
+    cursor = request.GET.get('cursor')
     images_only = request.GET.get('images_only')
     try:
-        images = paginator.page(page)
-    except PageNotAnInteger:
-        # Если страница не является целым числом,
-        # то доставить первую страницу
-        images = paginator.page(1)
-    except EmptyPage:
+        html, next_cursor = render_images_page(user_id, cursor)
+    except InvalidCursor:
         if images_only:
-            # Если AJAX-запрос и страница вне диапазона,
+            # Если AJAX-запрос с испорченным курсором,
             # то вернуть пустую страницу
             return HttpResponse('')
-        # Если страница вне диапазона,
-        # то вернуть последнюю страницу результатов
-        images = paginator.page(paginator.num_pages)
+        # Иначе доставить первую страницу
+        html, next_cursor = render_images_page(user_id)
     if images_only:
-        return render(request,
-                      'images/image/list_images.html',
-                      {'section': 'images',
-                       'images': images})
+        response = HttpResponse(html)
+        # курсор следующей страницы передается в заголовке
+        response['X-Next-Cursor'] = next_cursor or ''
+        return response
     return render(request,
                   'images/image/list.html',
                   {'section': 'images',
-                   'images': images})
-
+                   'images_html': html,
+                   'next_cursor': next_cursor})
 
 """
 В этом представлении создается набор запросов QuerySet, чтобы извлекать
@@ -161,15 +160,41 @@ def image_list(request):
 
 @login_required
 def image_ranking(request):
-    # получить словарь рейтинга изображений
-    image_ranking = r.zrange('image_ranking', 0, -1,
-                             desc=True)[:10]
-    image_ranking_ids = [int(id) for id in image_ranking]
-    # получить наиболее просматриваемые изображения
-    most_viewed = list(Image.objects.filter(
-        id__in=image_ranking_ids))
-    most_viewed.sort(key=lambda x: image_ranking_ids.index(x.id))
+    period = request.GET.get('period')
+    if period not in PERIODS:
+        period = 'trending'
+    # получить ИД наиболее просматриваемых изображений за период
+    image_ranking_ids = top_image_ids(period, 10)
+    images = Image.objects.in_bulk(image_ranking_ids)
+    most_viewed = [images[image_id] for image_id in image_ranking_ids
+                   if image_id in images]
     return render(request,
                   'images/image/ranking.html',
                   {'section': 'images',
+                   'period': period,
                    'most_viewed': most_viewed})
+
+
+@login_required
+def image_search(request):
+    query = request.GET.get('q', '').strip()
+    cursor = request.GET.get('cursor')
+    images_only = request.GET.get('images_only')
+    html, next_cursor = '', None
+    if query:
+        try:
+            html, next_cursor = render_search_page(query, cursor)
+        except InvalidCursor:
+            if images_only:
+                return HttpResponse('')
+            html, next_cursor = render_search_page(query)
+    if images_only:
+        response = HttpResponse(html)
+        response['X-Next-Cursor'] = next_cursor or ''
+        return response
+    return render(request,
+                  'images/image/search.html',
+                  {'section': 'search',
+                   'query': query,
+                   'images_html': html,
+                   'next_cursor': next_cursor})